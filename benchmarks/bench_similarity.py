@@ -0,0 +1,159 @@
+"""micro-benchmark of the per-question overhead of the similarity search
+
+Without arguments it compares the client-side serialization of the query vector:
+
+- before: the vector is adapted by psycopg2 as a float8 ARRAY literal, twice per statement, for
+  three statements (one per table)
+- after: one compact pgvector literal for the single prepared statement (sync path), or one
+  pgvector binary value per statement (async path)
+
+With `--config` it also times both statements against the configured database, on random
+embeddings loaded into a scratch schema that is dropped afterwards.
+
+Usage:
+    python benchmarks/bench_similarity.py [--dims 384 1536 4096] [--config data/base_config.yml]
+"""
+
+import argparse
+import time
+from typing import Any, Callable, Dict
+
+import numpy as np
+import yaml
+from psycopg2.extensions import adapt
+
+from codebase_analysis.db_utils.db import (
+    SIMILARITY_TABLES,
+    dbHandler,
+    encode_vector,
+    to_list,
+    vector_literal,
+)
+
+# the statement run per table before prepared statements
+LEGACY_QUERY = """
+    SELECT id, name, code, summary, summarized, (embedding <=> %s::vector) AS distance
+    FROM {table}
+    WHERE (embedding <=> %s::vector) <= 0.5
+    ORDER BY distance
+    LIMIT 3;
+"""
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> float:
+    """mean time of a call in milliseconds"""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench_serialization(dim: int, repeat: int) -> Dict[str, float]:
+    """compares the bytes and time needed to serialize the query vector of one question
+
+    :param dim: embedding dimension
+    :type dim: int
+    :param repeat: number of timed repetitions
+    :type repeat: int
+    :return: sizes (bytes) and times (ms) before and after
+    :rtype: Dict[str, float]
+    """
+    vector = np.random.default_rng(0).standard_normal(dim).astype(np.float32)
+    statements = len(SIMILARITY_TABLES)
+
+    def legacy() -> int:
+        # rendered twice per statement, one statement per table
+        return sum(len(adapt(to_list(vector)).getquoted()) * 2 for _ in range(statements))
+
+    def literal() -> int:
+        return len(vector_literal(vector))
+
+    def binary() -> int:
+        return sum(len(encode_vector(vector)) for _ in range(statements))
+
+    return {
+        "legacy_bytes": legacy(),
+        "legacy_ms": _time(legacy, repeat),
+        "prepared_bytes": literal(),
+        "prepared_ms": _time(literal, repeat),
+        "binary_bytes": binary(),
+        "binary_ms": _time(binary, repeat),
+    }
+
+
+def bench_database(config: Dict[str, Any], dim: int, rows: int, repeat: int) -> Dict[str, float]:
+    """times a question's similarity search with the legacy statements and the prepared statement
+
+    :param config: app config
+    :type config: Dict[str, Any]
+    :param dim: embedding dimension
+    :type dim: int
+    :param rows: rows loaded per table
+    :type rows: int
+    :param repeat: number of timed questions
+    :type repeat: int
+    :return: mean time per question (ms) before and after
+    :rtype: Dict[str, float]
+    """
+    db = dbHandler(config["postgres"], embedding_dim=dim, schema="bench_similarity")
+    try:
+        rng = np.random.default_rng(0)
+        db.bulk_load("files", ["id", "path"], ["int4", "text"], [(1, "bench.py")])
+        db.bulk_load(
+            "classes",
+            ["id", "file_id", "name", "code", "summary", "embedding"],
+            ["int4", "int4", "text", "text", "text", "vector"],
+            [(i + 1, 1, f"c{i}", "", "", rng.standard_normal(dim)) for i in range(rows)],
+        )
+        for table, parent in [("functions", "file_id"), ("methods", "class_id")]:
+            db.bulk_load(
+                table,
+                ["id", parent, "name", "code", "summary", "embedding"],
+                ["int4", "int4", "text", "text", "text", "vector"],
+                [(i + 1, 1, f"f{i}", "", "", rng.standard_normal(dim)) for i in range(rows)],
+            )
+        vector = rng.standard_normal(dim).astype(np.float32)
+
+        def legacy() -> None:
+            for table in SIMILARITY_TABLES:
+                db.cursor.execute(LEGACY_QUERY.format(table=table), (to_list(vector),) * 2)
+                db.cursor.fetchall()
+            db.conn.commit()
+
+        return {
+            "legacy_ms": _time(legacy, repeat),
+            "prepared_ms": _time(lambda: db.run_similarity(vector), repeat),
+        }
+    finally:
+        db.conn.rollback()
+        db.cursor.execute("DROP SCHEMA bench_similarity CASCADE;")
+        db.conn.commit()
+        db.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dims", type=int, nargs="+", default=[384, 1536, 4096])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--config", help="config file of the database to benchmark against")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per table for --config")
+    args = parser.parse_args()
+
+    print(f"{'dim':>6} {'legacy':>16} {'prepared':>16} {'binary (async)':>16}")
+    for dim in args.dims:
+        r = bench_serialization(dim, args.repeat)
+        print(
+            f"{dim:>6} "
+            f"{r['legacy_bytes'] / 1024:>7.1f} KB {r['legacy_ms']:>5.2f} ms "
+            f"{r['prepared_bytes'] / 1024:>7.1f} KB {r['prepared_ms']:>5.2f} ms "
+            f"{r['binary_bytes'] / 1024:>7.1f} KB {r['binary_ms']:>5.2f} ms"
+        )
+    if args.config is not None:
+        with open(args.config, "r") as f:
+            config = yaml.safe_load(f)
+        print(f"\nper question, {args.rows} rows per table")
+        print(f"{'dim':>6} {'legacy':>10} {'prepared':>10}")
+        for dim in args.dims:
+            r = bench_database(config, dim, args.rows, args.repeat)
+            print(f"{dim:>6} {r['legacy_ms']:>7.2f} ms {r['prepared_ms']:>7.2f} ms")
@@ -1,7 +1,22 @@
+import time
+
 import streamlit as st
 
-from codebase_analysis import Orchestrator
-from codebase_analysis.file_utils import download_repo
+from codebase_analysis import IndexJobQueue, QueryService
+
+CONFIG_PATH = "/workspace/data/base_config.yml"
+
+
+@st.cache_resource
+def get_query_service() -> QueryService:
+    """returns the query service shared by every session of the app"""
+    return QueryService(config_path=CONFIG_PATH).start()
+
+
+@st.cache_resource
+def get_job_queue() -> IndexJobQueue:
+    """returns the indexing job queue shared by every session of the app"""
+    return IndexJobQueue(config_path=CONFIG_PATH)
 
 
 def main():
@@ -13,35 +28,52 @@ def main():
     # define sidebar options
     st.sidebar.title("Enter a GitHub URL")
     st.session_state.repo_name = st.sidebar.text_input("GitHub URL:")
-
-    if "check" not in st.session_state:
-        st.session_state.check = False
+    fast_start = st.sidebar.checkbox(
+        "Fast start", help="Start chatting right away and summarize the code in the background."
+    )
 
     if st.sidebar.button("Begin Chat"):
-        st.session_state.check = True
-
-    # once URL is entered, download the repo and process it
-    if st.session_state.check:
-        # update instructions
-        subheader.subheader("Processing the repository. This may take a few minutes.")
-        # load data and create agent
-        if "repo_path" not in st.session_state:
-            # download the repo
-            st.session_state.repo_path = download_repo(st.session_state.repo_name)
-        if "orch" not in st.session_state and st.session_state.check:
+        # reuse the index (or the job in flight) of a repo submitted before, e.g. by another user
+        jobs = get_job_queue()
+        job_id = jobs.find(st.session_state.repo_name)
+        if job_id is None or jobs.status(job_id)["state"] == "failed":
+            job_id = jobs.submit(st.session_state.repo_name, lazy=fast_start)
+        st.session_state.job_id = job_id
+
+    # once URL is entered, the repo is downloaded and processed by a background job
+    if "job_id" in st.session_state:
+        status = get_job_queue().status(st.session_state.job_id)
+        if status["state"] == "failed":
+            subheader.subheader("Processing the repository failed.")
+            st.error(status.get("error"))
+            del st.session_state.job_id
+            return
+        if status["state"] in ("queued", "running"):
+            # update instructions and poll the job
             subheader.subheader("Processing the repository. This may take a few minutes.")
-            st.session_state.orch = Orchestrator(
-                config_path="/workspace/data/base_config.yml",
-                repo_path=st.session_state.repo_path,
-                init=True,
-            )
-            description, codebase = st.session_state.orch.get_stats()
-            st.sidebar.text(description)
-            st.session_state.orch.add_data(codebase)
-            st.session_state.repo_loaded = True
-
-        if st.session_state.get("repo_loaded", False):
+            if status["state"] == "queued":
+                st.sidebar.text("Waiting for a free worker...")
+            elif status["total"] > 0:
+                st.sidebar.progress(
+                    status["done"] / status["total"],
+                    text=f"{status['stage'].capitalize()} {status['done']}/{status['total']}",
+                )
+            else:
+                st.sidebar.text(f"{status['stage'].capitalize()}...")
+            time.sleep(1)
+            st.rerun()
+
+        if status["state"] in ("ready", "done"):
             subheader.subheader("The repository has been processed. Ask me anything!")
+            st.sidebar.text(status["description"])
+            if len(status["skipped_files"]) > 0:
+                with st.sidebar.expander("Skipped files"):
+                    st.text(
+                        "\n".join(
+                            f"{path.replace('/workspace/tmp/', '')} - {reason}"
+                            for path, reason in status["skipped_files"].items()
+                        )
+                    )
 
             if "messages" not in st.session_state:
                 st.session_state.messages = []
@@ -50,12 +82,21 @@ def main():
                 with st.chat_message(message["role"]):
                     st.markdown(message["content"])
 
+            if status["state"] == "ready" and status["stage"] == "backfilling":
+                done, total = status["done"], status["total"]
+                st.sidebar.progress(
+                    done / max(total, 1), text=f"Summarized {done}/{total} in the background"
+                )
+
+            with st.sidebar.expander("Query service stats"):
+                st.json(get_query_service().stats())
+
             user_input = st.chat_input("Input your query here")
             if user_input:
                 st.session_state.messages.append({"role": "user", "content": user_input})
                 with st.chat_message("user"):
                     st.markdown(user_input)
-                bot_response = st.session_state.orch.query(user_input)
+                bot_response = get_query_service().query(status["repo_path"], user_input)
                 st.session_state.messages.append({"role": "assistant", "content": bot_response})
                 with st.chat_message("assistant"):
                     st.markdown(bot_response)
@@ -1 +1,4 @@
-from .db_handler import Orchestrator
\ No newline at end of file
+from .async_handler import AsyncOrchestrator
+from .db_handler import Orchestrator
+from .service import QueryService
+from .jobs import IndexJobQueue
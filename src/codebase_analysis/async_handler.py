@@ -0,0 +1,227 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+import yaml
+
+from codebase_analysis.context import (
+    QA_TEMPLATE,
+    create_context_string,
+    find_citations,
+    order_context,
+    reformat,
+)
+from codebase_analysis.db_utils.async_db import asyncDbHandler
+from codebase_analysis.file_utils import hash_code
+from codebase_analysis.llm import AsyncEmbeddings, AsyncModelHandler
+from codebase_analysis.llm.prompts import (
+    QA_SYSTEM_PROMPT,
+    SUMMARIZATION_PROMPTS,
+    SUMMARIZATION_TEMPLATE,
+)
+
+
+class AsyncOrchestrator:
+    """asyncio-native query path over a repo that has already been indexed by Orchestrator; it
+    shares the prompt building and citation helpers of codebase_analysis.context with Orchestrator
+
+    The three similarity searches and the citation lookups run concurrently, and no state is kept
+    between questions, so one instance can serve many simultaneous chats. Cancelling the task
+    running `query` (e.g. when the user abandons a question) cancels the in-flight HTTP and
+    database calls.
+
+    Usage:
+        async with AsyncOrchestrator(config_path) as orch:
+            answer = await orch.query("How is the database populated?")
+    """
+
+    def __init__(
+        self,
+        config_path: str,
+        max_context: int = 5,
+        max_connections: int = 10,
+        schema: str = None,
+    ):
+        """initializes AsyncOrchestrator; call `connect` (or use it as an async context manager)
+        before querying
+
+        :param config_path: path to the config file
+        :type config_path: str
+        :param max_context: maximum number of summaries to provide the model for answering, defaults to 5
+        :type max_context: int, optional
+        :param max_connections: maximum number of pooled database connections, defaults to 10
+        :type max_connections: int, optional
+        :param schema: database schema of the repo (see `schema_name`), defaults to None (public)
+        :type schema: str, optional
+        """
+        with open(config_path, "r") as f:
+            self._config = yaml.safe_load(f)
+        self._max_context = max_context
+        self._model_handler = AsyncModelHandler(
+            self._config["llm"], system_message=QA_SYSTEM_PROMPT
+        )
+        self._embedder = AsyncEmbeddings(self._config["embeddings"])
+        self._db = asyncDbHandler(self._config["postgres"], max_size=max_connections, schema=schema)
+        # summarizations in flight, keyed by (type, code hash)
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def connect(self) -> None:
+        """opens the database connection pool"""
+        await self._db.connect()
+
+    async def close(self) -> None:
+        """closes the database connection pool and the model clients"""
+        await self._db.close()
+        await self._model_handler.close()
+        await self._embedder.close()
+
+    async def __aenter__(self) -> "AsyncOrchestrator":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _generate_embedding(self, text: str, retries: int = 3) -> List[float]:
+        """generates an embedding for the given text
+
+        :param text: text to generate embedding for
+        :type text: str
+        :param retries: number of attempts before falling back to a zero vector, defaults to 3
+        :type retries: int, optional
+        :return: embedding
+        :rtype: List[float]
+        """
+        for _ in range(retries):
+            try:
+                return await self._embedder.generate(text)
+            except Exception as e:
+                print(f"Error generating embedding: {e}")
+        return [0.0] * self._config["embeddings"]["embedding_dim"]
+
+    async def _generate_summary(self, _type: str, code: str) -> Tuple[str, List[float]]:
+        """summarizes code with the LLM and embeds the summary
+
+        :param _type: entity type
+        :type _type: str
+        :param code: code to summarize
+        :type code: str
+        :return: summary and embedding
+        :rtype: Tuple[str, List[float]]
+        """
+        summary = await self._model_handler.invoke(
+            SUMMARIZATION_TEMPLATE.format(code=code), sys_msg=SUMMARIZATION_PROMPTS[_type]
+        )
+        return summary, await self._generate_embedding(summary)
+
+    async def _summarize_code(self, _type: str, code: str) -> Tuple[str, List[float]]:
+        """summarizes code, sharing the summarization already in flight for the same code (e.g.
+        when concurrent questions retrieve the same item) instead of starting another
+
+        :param _type: entity type
+        :type _type: str
+        :param code: code to summarize
+        :type code: str
+        :return: summary and embedding
+        :rtype: Tuple[str, List[float]]
+        """
+        key = (_type, hash_code(code))
+        if key not in self._in_flight:
+            task = asyncio.ensure_future(self._generate_summary(_type, code))
+            self._in_flight[key] = task
+
+            def done(task: asyncio.Future) -> None:
+                self._in_flight.pop(key, None)
+                # mark the error as retrieved in case every waiting question was cancelled
+                if not task.cancelled():
+                    task.exception()
+
+            task.add_done_callback(done)
+        # one question giving up must not cancel the summarization for the others
+        return await asyncio.shield(self._in_flight[key])
+
+    async def _summarize_hit(self, result: Dict[str, Any]) -> None:
+        """replaces the provisional summary of a lazily indexed result with an LLM summary; the
+        provisional summary is kept if summarization fails
+
+        :param result: result from the database; its summary is updated in place
+        :type result: Dict[str, Any]
+        """
+        try:
+            summary, embedding = await self._summarize_code(result["type"], result["code"])
+        except Exception as e:
+            print(f"Error summarizing {result['type']}_{result['id']}: {e}")
+            return
+        await self._db.update_summary(
+            result["type"], result["id"], summary, embedding, hash_code(result["code"])
+        )
+        result["summary"] = summary
+        result["summarized"] = True
+
+    async def _summarize_hits(self, results: Dict[str, Dict[str, Any]]) -> None:
+        """summarizes, on demand and concurrently, the retrieved items that only have a provisional
+        summary
+
+        :param results: results from the database; their summaries are updated in place
+        :type results: Dict[str, Dict[str, Any]]
+        """
+        keys = order_context(results)[: self._max_context]
+        await asyncio.gather(
+            *[self._summarize_hit(results[k]) for k in keys if not results[k]["summarized"]]
+        )
+
+    async def _get_filepath(self, result: Dict[str, Any]) -> Tuple[str, str]:
+        """gets the file path (and potentially parent class name) of the result
+
+        :param result: result from the database
+        :type result: Dict[str, Any]
+        :return: file path
+        :rtype: Tuple[str, str]
+        """
+        return await self._db.get_filepath(result["type"], result["id"])
+
+    async def _get_filepaths(
+        self, response: str, results: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, Tuple[str, str]]:
+        """looks up the file paths of every result cited in the response concurrently
+
+        :param response: response
+        :type response: str
+        :param results: results from the database
+        :type results: Dict[str, Dict[str, Any]]
+        :return: file path and parent class name for each cited key
+        :rtype: Dict[str, Tuple[str, str]]
+        """
+        keys = find_citations(response, results)
+        paths = await asyncio.gather(*[self._get_filepath(results[k]) for k in keys])
+        return dict(zip(keys, paths))
+
+    async def answer(self, query: str, vec: List[float]) -> str:
+        """answers the query given its precomputed embedding
+
+        :param query: user question
+        :type query: str
+        :param vec: embedding of the question
+        :type vec: List[float]
+        :return: response from the model
+        :rtype: str
+        """
+        results = await self._db.run_similarity(vec)
+        await self._summarize_hits(results)
+        context = create_context_string(results, self._max_context)
+        response = await self._model_handler.invoke(
+            QA_TEMPLATE.format(context=context, query=query),
+            sys_msg=QA_SYSTEM_PROMPT,
+        )
+        paths = await self._get_filepaths(response, results)
+        return reformat(response, results, paths, self._max_context)
+
+    async def query(self, query: str) -> str:
+        """queries the database for the given query
+
+        :param query: user question
+        :type query: str
+        :return: response from the model
+        :rtype: str
+        """
+        vec = await self._generate_embedding(query)
+        return await self.answer(query, vec)
@@ -0,0 +1,72 @@
+import threading
+from typing import TYPE_CHECKING, Tuple
+
+if TYPE_CHECKING:
+    from codebase_analysis.db_handler import Orchestrator
+
+# classes first since their summaries cover the most code per LLM call
+PRIORITY = {"classes": 0, "functions": 1, "methods": 2}
+
+
+class Backfiller:
+    """LLM-summarizes the items of a lazily indexed repo in a background thread
+
+    Items that a query already summarized on demand are skipped.
+    """
+
+    def __init__(self, orchestrator: "Orchestrator"):
+        """initializes Backfiller
+
+        :param orchestrator: orchestrator dedicated to the backfill (it is used from another thread)
+        :type orchestrator: Orchestrator
+        """
+        self._orch = orchestrator
+        self._pending = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.done = 0
+        self.total = 0
+
+    def start(self) -> "Backfiller":
+        """loads the pending items and starts the background thread
+
+        :return: the started backfiller
+        :rtype: Backfiller
+        """
+        self._pending = sorted(
+            self._orch.get_pending(), key=lambda item: (PRIORITY[item[0]], item[1])
+        )
+        self.total = len(self._pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """stops the backfill after the item in progress"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def is_running(self) -> bool:
+        """whether items are still being summarized"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def progress(self) -> Tuple[int, int]:
+        """returns the number of processed and total pending items
+
+        :return: processed and total items
+        :rtype: Tuple[int, int]
+        """
+        return self.done, self.total
+
+    def _run(self) -> None:
+        """summarizes the pending items in priority order"""
+        for _type, _id in self._pending:
+            if self._stop.is_set():
+                break
+            try:
+                self._orch.summarize_pending(_type, _id)
+            except Exception as e:
+                print(f"Error summarizing {_type} {_id}: {e}")
+            self.done += 1
@@ -0,0 +1,102 @@
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# prompt for answering a question from the retrieved summaries
+QA_TEMPLATE = "CONTEXT:\n{context}\nQUESTION: {query}\nANSWER:\n"
+
+
+def order_context(results: Dict[str, Dict[str, Any]]) -> List[str]:
+    """orders the context to be used in the prompt
+
+    :param results: results from the database
+    :type results: Dict[str, Dict[str, Any]]
+    :return: ordered keys
+    :rtype: List[str]
+    """
+    keys, dist = [], []
+    for k, v in results.items():
+        keys.append(k)
+        dist.append(v["cos_dist"])
+    ordered_keys = [keys[int(d)] for d in np.argsort(dist)]
+    return ordered_keys
+
+
+def create_context_string(results: Dict[str, Dict[str, Any]], max_context: int) -> str:
+    """creates a context string from the results
+
+    :param results: results from the database
+    :type results: Dict[str, Dict[str, Any]]
+    :param max_context: maximum number of summaries to include
+    :type max_context: int
+    :return: context string
+    :rtype: str
+    """
+    ordered_keys = order_context(results)
+    context = ""
+    for k in ordered_keys[:max_context]:
+        context += f"[{k}]: Name - {results[k]['name']}, Summary - {results[k]['summary']}\n\n"
+    return context
+
+
+def find_citations(response: str, results: Dict[str, Dict[str, Any]]) -> List[str]:
+    """finds the result keys that the response cites
+
+    :param response: response
+    :type response: str
+    :param results: results from the database
+    :type results: Dict[str, Dict[str, Any]]
+    :return: keys that appear in the response
+    :rtype: List[str]
+    """
+    return [k for k in results if k in response]
+
+
+def reformat(
+    response: str,
+    results: Dict[str, Dict[str, Any]],
+    paths: Dict[str, Tuple[str, str]],
+    max_context: int,
+) -> str:
+    """reformats the response to clean up the in-text citations and provide the path to the code
+
+    :param response: response
+    :type response: str
+    :param results: results from the database
+    :type results: Dict[str, Dict[str, Any]]
+    :param paths: file paths (and parent class names) of the cited keys (see `find_citations`)
+    :type paths: Dict[str, Tuple[str, str]]
+    :param max_context: maximum number of summaries provided to the model
+    :type max_context: int
+    :return: reformatted response
+    :rtype: str
+    """
+    citation_counter = 1
+    citation_dict = {}
+    for k in results:
+        if k in response:
+            path, class_name = paths[k]
+            response = response.replace(k, str(citation_counter))
+            citation_dict[citation_counter] = {
+                "path": path,
+                "class_name": class_name,
+                "name": results[k]["name"],
+                "type": results[k]["type"],
+            }
+            citation_counter += 1
+    if len(citation_dict) > 0:
+        response += "\n\nREFERENCES:\n"
+        for k in citation_dict:
+            path = citation_dict[k]["path"].replace("/workspace/tmp/", "")
+            class_name = citation_dict[k]["class_name"]
+            name = citation_dict[k]["name"]
+            response += f"[{k}]: {name} - (path: {path})\n"
+            if citation_dict[k]["type"] == "methods":
+                response = response.replace(
+                    f"[{k}]: {name}",
+                    f"[{k}]: class: {class_name}.{name}",
+                )
+        response = response[:-1]
+    for i in range(max_context):
+        response = response.replace(f"([{i+1}])", f"[{i+1}]")
+    return response
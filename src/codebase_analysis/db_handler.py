@@ -1,24 +1,59 @@
+import json
 import yaml
-from typing import Any, Dict, List, Tuple
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 
 import numpy as np
 
-from codebase_analysis.db_utils import dbHandler
-from codebase_analysis.file_utils import find_classes, find_funcs, get_all_files
+from codebase_analysis.backfill import Backfiller
+from codebase_analysis.context import (
+    QA_TEMPLATE,
+    create_context_string,
+    find_citations,
+    order_context,
+    reformat,
+)
+from codebase_analysis.db_utils import dbHandler, export_snapshot, import_snapshot
+from codebase_analysis.file_utils import (
+    ENTITY_LABELS,
+    TRIVIAL_TIERS,
+    Entity,
+    classify_entity,
+    describe_entity,
+    find_entities,
+    hash_code,
+    open_source,
+    select_files,
+)
 from codebase_analysis.llm import Embeddings, ModelHandler
 from codebase_analysis.llm.prompts import (
-    CLASS_SUMMARIZATION_PROMPT,
     FUNCTION_SUMMARIZATION_PROMPT,
-    METHOD_SUMMARIZATION_PROMPT,
+    PACKED_ITEM_TEMPLATE,
+    PACKED_SUMMARIZATION_PROMPT,
     QA_SYSTEM_PROMPT,
+    SUMMARIZATION_PROMPTS,
+    SUMMARIZATION_TEMPLATE,
 )
 
+# summaries kept for items that share their code with items summarized before (the most recent
+# ones); copies are normally updated together by their code hash, so this mostly serves rows stored
+# before code hashes were; bounded so that a backfill does not hold every summary and embedding
+SUMMARY_CACHE_SIZE = 256
+
+# summaries embedded per request
+EMBEDDING_BATCH_SIZE = 64
+
 
 class Orchestrator:
     """Orchestrator class to handle the database and model interactions"""
 
     def __init__(
-        self, config_path: str, repo_path: str = None, max_context: int = 5, init: bool = True
+        self,
+        config_path: str,
+        repo_path: str = None,
+        max_context: int = 5,
+        init: bool = True,
+        schema: str = None,
     ):
         """initializes Orchestrator
 
@@ -30,9 +65,13 @@ class Orchestrator:
         :type max_context: int, optional
         :param init: whether to initialize the database, defaults to True
         :type init: bool, optional
+        :param schema: database schema for this repo (see `schema_name`), defaults to None (public)
+        :type schema: str, optional
         """
+        self._config_path = config_path
         self._config = self._load_config(config_path)
         self._max_context = max_context
+        self._schema = schema
         self._model_handler = ModelHandler(
             self._config["llm"], system_message=FUNCTION_SUMMARIZATION_PROMPT
         )
@@ -41,9 +80,20 @@ class Orchestrator:
             self._config["postgres"],
             embedding_dim=self._config["embeddings"]["embedding_dim"],
             init=init,
+            schema=schema,
         )
         if repo_path is not None:
             self._config["codebase"]["path"] = repo_path
+        self.summary_stats = {
+            "entities": 0,
+            "unique": 0,
+            "llm_calls": 0,
+            "packed_requests": 0,
+            "llm_calls_saved": 0,
+            "tiers": {},
+        }
+        self.skipped_files = {}
+        self._summary_cache: Dict[Tuple[str, str], Tuple[str, np.ndarray]] = OrderedDict()
 
     def _load_config(self, path: str) -> Dict[str, Any]:
         """loads the config file
@@ -63,15 +113,21 @@ class Orchestrator:
         :return: breakdown of the repo
         :rtype: Dict[str, Any]
         """
-        files = get_all_files(
-            path=self._config["codebase"]["path"],
+        options = self._config["codebase"]
+        files, self.skipped_files = select_files(
+            path=options["path"],
             file_type=".py",
+            include=options.get("include"),
+            exclude=options.get("exclude"),
+            skip_vendored=options.get("skip_vendored", True),
+            respect_gitignore=options.get("respect_gitignore", True),
+            max_file_kb=options.get("max_file_kb"),
+            max_file_lines=options.get("max_file_lines"),
         )
         codebase = {}
         for file in files:
             codebase[file] = {}
-            codebase[file]["classes"] = find_classes(file)
-            codebase[file]["functions"] = find_funcs(file)
+            codebase[file]["classes"], codebase[file]["functions"] = find_entities(file)
         return codebase
 
     def get_stats(self) -> Tuple[str, Dict[str, Any]]:
@@ -87,21 +143,28 @@ class Orchestrator:
             stats["functions"] += len(breakdown[file]["functions"])
             stats["classes"] += len(breakdown[file]["classes"])
             for class_ in breakdown[file]["classes"]:
-                stats["methods"] += len(breakdown[file]["classes"][class_]["methods"])
+                stats["methods"] += len(breakdown[file]["classes"][class_].methods)
+        entities = stats["functions"] + stats["classes"] + stats["methods"]
+        duplicates = entities - len(self._dedup(breakdown))
         description = "The codebase contains the following:\n"
         description += f"- {stats['files']} files\n"
         description += f"- {stats['functions']} functions\n"
         description += f"- {stats['classes']} classes\n"
         description += f"- {stats['methods']} methods\n"
+        description += f"- {duplicates} duplicate code bodies (summarized once)\n"
+        if len(self.skipped_files) > 0:
+            reasons = Counter(reason.split(":")[0] for reason in self.skipped_files.values())
+            details = ", ".join(f"{reason}: {count}" for reason, count in reasons.most_common())
+            description += f"- {len(self.skipped_files)} files skipped ({details})\n"
         return description, breakdown
 
-    def _generate_embedding(self, text: str) -> List[float]:
+    def _generate_embedding(self, text: str) -> np.ndarray:
         """generates an embedding for the given text
 
         :param text: text to generate embedding for
         :type text: str
-        :return: embedding
-        :rtype: List[float]
+        :return: embedding (float32)
+        :rtype: np.ndarray
         """
         embedding = [0.0] * self._config["embeddings"]["embedding_dim"]
         done = False
@@ -113,9 +176,9 @@ class Orchestrator:
             except Exception as e:
                 print(f"Error generating embedding: {e}")
                 count += 1
-        return embedding
+        return np.asarray(embedding, dtype=np.float32)
 
-    def _get_summary_and_embedding(self, code: str, sys_msg: str) -> Tuple[str, List[float]]:
+    def _get_summary_and_embedding(self, code: str, sys_msg: str) -> Tuple[str, np.ndarray]:
         """gets the summary and embedding of the code
 
         :param code: code to get the summary and embedding of
@@ -123,83 +186,435 @@ class Orchestrator:
         :param sys_msg: system message to use for the model
         :type sys_msg: str
         :return: summary and embedding
-        :rtype: Tuple[str, List[float]]
+        :rtype: Tuple[str, np.ndarray]
         """
-        template = "INPUT:\n```\n{code}\n```\nSUMMARY:\n"
-        summary = self._model_handler.invoke(template.format(code=code), sys_msg=sys_msg)
+        summary = self._model_handler.invoke(
+            SUMMARIZATION_TEMPLATE.format(code=code), sys_msg=sys_msg
+        )
         self._model_handler.clear_messages()
         embedding = self._generate_embedding(summary)
         return summary, embedding
 
-    def _add_summaries(self, filedict: Dict[str, str]) -> Dict[str, str]:
-        """adds summaries to the functions and classes in the filedict
+    def _generate_embeddings(
+        self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE
+    ) -> List[np.ndarray]:
+        """generates embeddings for many texts, several texts per request
 
-        :param filedict: dictionary of files
-        :type filedict: Dict[str, str]
-        :return: dictionary of files with summaries and embeddings
-        :rtype: Dict[str, str]
+        :param texts: texts to generate embeddings for
+        :type texts: List[str]
+        :param batch_size: number of texts per request, defaults to 64
+        :type batch_size: int, optional
+        :return: embeddings (float32)
+        :rtype: List[np.ndarray]
+        """
+        embeddings = []
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i : i + batch_size]
+            try:
+                vectors = self._embedder.generate_batch(batch)
+            except Exception as e:
+                print(f"Error generating embeddings: {e}")
+                vectors = [self._generate_embedding(text) for text in batch]
+            embeddings += [np.asarray(vector, dtype=np.float32) for vector in vectors]
+        return embeddings
+
+    def _iter_entities(self, codebase: Dict[str, Any]) -> Iterator[Tuple[str, Entity]]:
+        """iterates over every function, class, and method of the codebase
+
+        :param codebase: codebase breakdown
+        :type codebase: Dict[str, Any]
+        :return: entity type (table name) and entity
+        :rtype: Iterator[Tuple[str, Entity]]
         """
-        for funcname in filedict["functions"]:
-            code = filedict["functions"][funcname]["text"]
-            summary, embedding = self._get_summary_and_embedding(
-                code, sys_msg=FUNCTION_SUMMARIZATION_PROMPT
+        for file in codebase:
+            for funcname in codebase[file]["functions"]:
+                yield "functions", codebase[file]["functions"][funcname]
+            for classname in codebase[file]["classes"]:
+                yield "classes", codebase[file]["classes"][classname]
+                for methodname in codebase[file]["classes"][classname].methods:
+                    yield "methods", codebase[file]["classes"][classname].methods[methodname]
+
+    def _dedup(self, codebase: Dict[str, Any]) -> Dict[Tuple[str, str], List[Entity]]:
+        """groups the entities of the codebase by type and normalized code hash
+
+        :param codebase: codebase breakdown
+        :type codebase: Dict[str, Any]
+        :return: entities sharing the same code, keyed by (type, hash)
+        :rtype: Dict[Tuple[str, str], List[Entity]]
+        """
+        groups = {}
+        for _type, entity in self._iter_entities(codebase):
+            groups.setdefault((_type, hash_code(entity.text)), []).append(entity)
+        return groups
+
+    def _classify(self, groups: Dict[Tuple[str, str], List[Entity]]) -> Dict[Tuple[str, str], str]:
+        """assigns each unique entity to a cost tier (see `classify_entity`)
+
+        :param groups: entities sharing the same code, keyed by (type, hash)
+        :type groups: Dict[Tuple[str, str], List[Entity]]
+        :return: tier of each group; every group is "llm" when `summarization.cost_tiers` is off
+        :rtype: Dict[Tuple[str, str], str]
+        """
+        options = self._config.get("summarization", {})
+        if not options.get("cost_tiers", False):
+            return {key: "llm" for key in groups}
+        max_lines = options.get("trivial_max_lines", 4)
+        return {key: classify_entity(groups[key][0].text, max_lines) for key in groups}
+
+    def _trivial_summary(self, _type: str, entity: Entity, tier: str) -> str:
+        """builds the summary of a trivial entity without calling an LLM
+
+        :param _type: entity type
+        :type _type: str
+        :param entity: trivial entity
+        :type entity: Entity
+        :param tier: tier of the entity (a key of TRIVIAL_TIERS)
+        :type tier: str
+        :return: templated summary, or the code itself with `summarization.trivial_summary: code`
+        :rtype: str
+        """
+        if self._config["summarization"].get("trivial_summary", "template") == "code":
+            return entity.text
+        return f"{describe_entity(_type, entity)}\n{TRIVIAL_TIERS[tier]}"
+
+    def _pack(self, groups: List[List[Entity]]) -> List[List[int]]:
+        """groups small entities into packs for multi-entity summarization requests
+
+        Sizes are estimated from the byte spans (about 4 bytes per token), so no code is read.
+
+        :param groups: unique entities (each given by its copies)
+        :type groups: List[List[Entity]]
+        :return: indices of the groups in each pack; packs hold at least two entities
+        :rtype: List[List[int]]
+        """
+        options = self._config.get("summarization", {})
+        budget = options.get("pack_token_budget", 2048)
+        max_entity = options.get("pack_max_entity_tokens", 256)
+        packs, pack, pack_tokens = [], [], 0
+        for i, entities in enumerate(groups):
+            tokens = (entities[0].end - entities[0].start) / 4
+            if tokens > max_entity:
+                continue
+            if pack_tokens + tokens > budget and len(pack) > 0:
+                packs.append(pack)
+                pack, pack_tokens = [], 0
+            pack.append(i)
+            pack_tokens += tokens
+        packs.append(pack)
+        return [pack for pack in packs if len(pack) > 1]
+
+    def _parse_packed(self, response: str, count: int) -> List[str]:
+        """parses the JSON object answering a packed summarization request
+
+        :param response: model response
+        :type response: str
+        :param count: number of entities in the request
+        :type count: int
+        :return: summary of each entity, None where the response has no usable summary
+        :rtype: List[str]
+        """
+        try:
+            parsed = json.loads(response[response.index("{") : response.rindex("}") + 1])
+        except ValueError:
+            return [None] * count
+        if not isinstance(parsed, dict):
+            return [None] * count
+        summaries = [parsed.get(str(i + 1)) for i in range(count)]
+        return [s if isinstance(s, str) and len(s.strip()) > 0 else None for s in summaries]
+
+    def _summarize_packed(self, items: List[Tuple[str, Entity]]) -> List[str]:
+        """summarizes several entities with a single LLM request
+
+        :param items: entity type and entity of each item
+        :type items: List[Tuple[str, Entity]]
+        :return: summary of each entity, None where the response could not be parsed
+        :rtype: List[str]
+        """
+        message = "INPUT:\n"
+        for i, (_type, entity) in enumerate(items):
+            message += PACKED_ITEM_TEMPLATE.format(
+                id=i + 1, kind=ENTITY_LABELS[_type].lower(), code=entity.text
             )
-            filedict["functions"][funcname]["summary"] = summary
-            filedict["functions"][funcname]["embedding"] = embedding
-        for classname in filedict["classes"]:
-            code = filedict["classes"][classname]["text"]
-            summary, embedding = self._get_summary_and_embedding(
-                code, sys_msg=CLASS_SUMMARIZATION_PROMPT
+        message += "SUMMARY:\n"
+        response = self._model_handler.invoke(message, sys_msg=PACKED_SUMMARIZATION_PROMPT)
+        self._model_handler.clear_messages()
+        return self._parse_packed(response, len(items))
+
+    def _add_summaries(
+        self, codebase: Dict[str, Any], progress: Callable[[str, int, int], None] = None
+    ) -> Iterator[str]:
+        """adds summaries to the functions, classes, and methods of the codebase; each unique code
+        body is summarized once and the result is shared by all of its copies
+
+        With `summarization.packing` enabled, small entities are summarized several per request; any
+        entity missing from a packed response falls back to its own request. With
+        `summarization.cost_tiers` enabled, trivial entities get a templated summary instead.
+
+        Files are yielded as soon as all of their entities are summarized, so they can be stored
+        without waiting for the rest of the repo. An entity whose summarization fails keeps a
+        provisional summary (see `describe_entity`) and is left pending for `start_backfill`.
+
+        :param codebase: codebase breakdown
+        :type codebase: Dict[str, Any]
+        :param progress: called with ("summarizing", done, total) as the LLM summaries come in,
+            defaults to None
+        :type progress: Callable[[str, int, int], None], optional
+        :return: paths of the files whose entities all have a summary and an embedding
+        :rtype: Iterator[str]
+        """
+        report = progress or (lambda stage, done, total: None)
+        groups = self._dedup(codebase)
+        tiers = self._classify(groups)
+        # groups whose summaries each file still waits for
+        waiting = {file: set() for file in codebase}
+        for key, entities in groups.items():
+            for entity in entities:
+                waiting[entity.path].add(key)
+        for file in [file for file in waiting if len(waiting[file]) == 0]:
+            del waiting[file]
+            yield file
+        resolved: List[Tuple[Tuple[str, str], str, bool]] = []
+
+        def flush() -> Iterator[str]:
+            """embeds the resolved summaries and yields the files that are now complete"""
+            embeddings = self._generate_embeddings([summary for _, summary, _ in resolved])
+            for (key, summary, summarized), embedding in zip(resolved, embeddings):
+                for entity in groups[key]:
+                    entity.summary = summary
+                    entity.embedding = embedding
+                    entity.summarized = summarized
+                    waiting[entity.path].discard(key)
+                    if len(waiting[entity.path]) == 0:
+                        del waiting[entity.path]
+                        yield entity.path
+            resolved.clear()
+
+        trivial = [key for key in groups if tiers[key] != "llm"]
+        for key in trivial:
+            resolved.append((key, self._trivial_summary(key[0], groups[key][0], tiers[key]), True))
+        keys = [key for key in groups if tiers[key] == "llm"]
+        # requests run in the order of the entities, so the files complete one after the other
+        packs = []
+        if self._config.get("summarization", {}).get("packing", False):
+            packs = self._pack([groups[key] for key in keys])
+        packed = {i for pack in packs for i in pack}
+        requests = sorted(packs + [[i] for i in range(len(keys)) if i not in packed])
+        llm_calls, packed_requests, failed, done = 0, 0, 0, 0
+        report("summarizing", done, len(keys))
+        for request in requests:
+            summaries = [None] * len(request)
+            if len(request) > 1:
+                items = [(keys[i][0], groups[keys[i]][0]) for i in request]
+                try:
+                    summaries = self._summarize_packed(items)
+                except Exception as e:
+                    print(f"Error summarizing a pack of {len(items)} entities: {e}")
+                    self._model_handler.clear_messages()
+                llm_calls += 1
+                packed_requests += 1
+            for i, summary in zip(request, summaries):
+                _type = keys[i][0]
+                summarized = True
+                if summary is None:
+                    try:
+                        summary = self._model_handler.invoke(
+                            SUMMARIZATION_TEMPLATE.format(code=groups[keys[i]][0].text),
+                            sys_msg=SUMMARIZATION_PROMPTS[_type],
+                        )
+                    except Exception as e:
+                        print(f"Error summarizing {groups[keys[i]][0].path}: {e}")
+                        summary = describe_entity(_type, groups[keys[i]][0])
+                        summarized = False
+                        failed += 1
+                    self._model_handler.clear_messages()
+                    llm_calls += 1
+                resolved.append((keys[i], summary, summarized))
+                done += 1
+            report("summarizing", done, len(keys))
+            if len(resolved) >= EMBEDDING_BATCH_SIZE:
+                yield from flush()
+        yield from flush()
+        entity_count = sum(len(entities) for entities in groups.values())
+        self.summary_stats = {
+            "entities": entity_count,
+            "unique": len(groups),
+            "llm_calls": llm_calls,
+            "packed_requests": packed_requests,
+            "llm_calls_saved": entity_count - llm_calls,
+            # LLM calls saved by each trivial tier (one per unique entity)
+            "tiers": dict(Counter(tiers[key] for key in trivial)),
+            # unique entities left with a provisional summary
+            "failed": failed,
+        }
+        print(
+            f"Summarized {entity_count} entities with {llm_calls} LLM calls "
+            f"({entity_count - len(groups)} saved by deduplication, "
+            f"{len(keys) - llm_calls} by packing, "
+            f"{len(trivial)} by cost tiers, {failed} failed)."
+        )
+
+    def _add_signal_summaries(self, codebase: Dict[str, Any]) -> Dict[str, Any]:
+        """adds provisional summaries built from cheap signals (name, signature, docstring) and embeds
+        them directly, without any LLM call
+
+        :param codebase: codebase breakdown
+        :type codebase: Dict[str, Any]
+        :return: codebase with provisional summaries and embeddings
+        :rtype: Dict[str, Any]
+        """
+        groups = self._dedup(codebase)
+        tiers = self._classify(groups)
+        descriptions = [
+            (
+                describe_entity(key[0], entities[0])
+                if tiers[key] == "llm"
+                else self._trivial_summary(key[0], entities[0], tiers[key])
             )
-            filedict["classes"][classname]["summary"] = summary
-            filedict["classes"][classname]["embedding"] = embedding
-            for methodname in filedict["classes"][classname]["methods"]:
-                code = filedict["classes"][classname]["methods"][methodname]["text"]
-                summary, embedding = self._get_summary_and_embedding(
-                    code, sys_msg=METHOD_SUMMARIZATION_PROMPT
-                )
-                filedict["classes"][classname]["methods"][methodname]["summary"] = summary
-                filedict["classes"][classname]["methods"][methodname]["embedding"] = embedding
-        return filedict
-
-    def add_data(self, codebase: Dict[str, Any]) -> None:
+            for key, entities in groups.items()
+        ]
+        embeddings = self._generate_embeddings(descriptions)
+        for key, description, embedding in zip(groups, descriptions, embeddings):
+            for entity in groups[key]:
+                entity.summary = description
+                entity.embedding = embedding
+                # trivial entities are final already, so the backfill skips them
+                entity.summarized = tiers[key] != "llm"
+        entity_count = sum(len(entities) for entities in groups.values())
+        pending = sum(tiers[key] == "llm" for key in groups)
+        self.summary_stats = {
+            "entities": entity_count,
+            "unique": len(groups),
+            "llm_calls": 0,
+            "packed_requests": 0,
+            # at most one LLM call per pending unique entity is left to the backfill
+            "llm_calls_saved": entity_count - pending,
+            "tiers": dict(Counter(tiers[key] for key in groups if tiers[key] != "llm")),
+            "failed": 0,
+            "pending": pending,
+        }
+        print(
+            f"Indexed {entity_count} entities from their signatures; summaries for {pending} unique "
+            "entities will be backfilled."
+        )
+        return codebase
+
+    def add_data(
+        self,
+        codebase: Dict[str, Any],
+        lazy: bool = False,
+        progress: Callable[[str, int, int], None] = None,
+    ) -> None:
         """add all files, function, classes, and methods to the database
 
         :param codebase: codebase breakdown to add to the db
         :type codebase: Dict[str, Any]
+        :param lazy: whether to index cheap signals only and leave the LLM summaries to queries and
+            `start_backfill`, defaults to False
+        :type lazy: bool, optional
+        :param progress: called with (stage, done, total) as the summaries are generated
+            ("summarizing") or, when lazy, as the files are stored ("storing"), defaults to None
+        :type progress: Callable[[str, int, int], None], optional
         """
-        for key in codebase:
-            codebase[key] = self._add_summaries(codebase[key])
-            self._db.add_file(key, codebase[key])
+        if lazy:
+            for i, key in enumerate(self._add_signal_summaries(codebase)):
+                self._db.add_file(key, codebase[key])
+                if progress is not None:
+                    progress("storing", i + 1, len(codebase))
+        else:
+            # each file is stored as soon as its summaries are in, so a crash keeps the finished work
+            for key in self._add_summaries(codebase, progress=progress):
+                self._db.add_file(key, codebase[key])
+        # release the memory maps of the source files
+        open_source.cache_clear()
 
-    def _order_context(self, results: Dict[str, Dict[str, Any]]) -> List[str]:
-        """orders the context to be used in the prompt
+    def get_pending(self) -> List[Tuple[str, int]]:
+        """lists the items of a lazily indexed repo that still lack an LLM summary
 
-        :param results: results from the database
-        :type results: Dict[str, Dict[str, Any]]
-        :return: ordered keys
-        :rtype: List[str]
+        :return: table and id of each pending item
+        :rtype: List[Tuple[str, int]]
         """
-        keys, dist = [], []
-        for k, v in results.items():
-            keys.append(k)
-            dist.append(v["cos_dist"])
-        ordered_keys = [keys[int(d)] for d in np.argsort(dist)]
-        return ordered_keys
+        return self._db.get_unsummarized()
 
-    def _create_context_string(self, results: Dict[str, Dict[str, Any]]) -> str:
-        """creates a context string from the results
+    def summarize_pending(self, _type: str, _id: int) -> str:
+        """replaces the provisional summary of an item, and of the pending copies of its code, with an
+        LLM summary, unless that was done already
 
-        :param results: results from the database
-        :type results: Dict[str, Dict[str, Any]]
-        :return: context string
+        :param _type: table of the item
+        :type _type: str
+        :param _id: id of the item
+        :type _id: int
+        :return: current summary of the item, None if it does not exist
         :rtype: str
         """
-        ordered_keys = self._order_context(results)
-        context = ""
-        for k in ordered_keys[: self._max_context]:
-            context += f"[{k}]: Name - {results[k]['name']}, Summary - {results[k]['summary']}\n\n"
-        return context
+        item = self._db.get_item(_type, _id)
+        if item is None:
+            return None
+        code, summary, summarized = item
+        if summarized:
+            return summary
+        key = (_type, hash_code(code))
+        if key in self._summary_cache:
+            self._summary_cache.move_to_end(key)
+        else:
+            self._summary_cache[key] = self._get_summary_and_embedding(
+                code, sys_msg=SUMMARIZATION_PROMPTS[_type]
+            )
+            if len(self._summary_cache) > SUMMARY_CACHE_SIZE:
+                self._summary_cache.popitem(last=False)
+        summary, embedding = self._summary_cache[key]
+        self._db.update_summary(_type, _id, summary, embedding, key[1])
+        return summary
+
+    def start_backfill(self) -> Backfiller:
+        """starts summarizing the pending items of a lazily indexed repo in the background
+
+        :return: the running backfiller (see `Backfiller.progress`)
+        :rtype: Backfiller
+        """
+        worker = Orchestrator(
+            self._config_path, max_context=self._max_context, init=False, schema=self._schema
+        )
+        return Backfiller(worker).start()
+
+    def export_index(self, path: str) -> Dict[str, int]:
+        """exports the indexed repo to a portable snapshot file
+
+        :param path: destination .npz file
+        :type path: str
+        :return: number of exported rows per table
+        :rtype: Dict[str, int]
+        """
+        return export_snapshot(self._db, path)
+
+    def import_index(self, path: str) -> Dict[str, int]:
+        """replaces the indexed repo with the contents of a snapshot file (no summarization needed)
+
+        :param path: .npz file written by export_index
+        :type path: str
+        :raises ValueError: if the snapshot does not match the configured embedding dimension
+        :raises psycopg2.Error: if loading fails; the index is left unchanged
+        :return: number of imported rows per table
+        :rtype: Dict[str, int]
+        """
+        return import_snapshot(self._db, path)
+
+    def _summarize_hits(self, results: Dict[str, Dict[str, Any]]) -> None:
+        """summarizes, on demand, the retrieved items that only have a provisional summary; an item
+        whose summarization fails keeps its provisional summary
+
+        :param results: results from the database; their summaries are updated in place
+        :type results: Dict[str, Dict[str, Any]]
+        """
+        for k in order_context(results)[: self._max_context]:
+            if not results[k]["summarized"]:
+                try:
+                    summary = self.summarize_pending(results[k]["type"], results[k]["id"])
+                except Exception as e:
+                    print(f"Error summarizing {k}: {e}")
+                    continue
+                if summary is not None:
+                    results[k]["summary"] = summary
+                    results[k]["summarized"] = True
 
     def _get_filepath(self, result: Dict[str, Any]) -> Tuple[str, str]:
         """gets the file path (and potentially parent class name) of the result
@@ -227,46 +642,6 @@ class Orchestrator:
             output = self._db.run_basic_query(query)
             return output[0][0], output[0][1]
 
-    def _reformat(self, response: str, results: Dict[str, Dict[str, Any]]) -> str:
-        """reformats the response to clean up the in-text citations and provide the path to the code
-
-        :param response: response
-        :type response: str
-        :param results: results from the database
-        :type results: Dict[str, Dict[str, Any]]
-        :return: reformatted response
-        :rtype: str
-        """
-        citation_counter = 1
-        citation_dict = {}
-        for k in results:
-            if k in response:
-                path, class_name = self._get_filepath(results[k])
-                response = response.replace(k, str(citation_counter))
-                citation_dict[citation_counter] = {
-                    "path": path,
-                    "class_name": class_name,
-                    "name": results[k]["name"],
-                    "type": results[k]["type"],
-                }
-                citation_counter += 1
-        if len(citation_dict) > 0:
-            response += "\n\nREFERENCES:\n"
-            for k in citation_dict:
-                path = citation_dict[k]["path"].replace("/workspace/tmp/", "")
-                class_name = citation_dict[k]["class_name"]
-                name = citation_dict[k]["name"]
-                response += f"[{k}]: {name} - (path: {path})\n"
-                if citation_dict[k]["type"] == "methods":
-                    response = response.replace(
-                        f"[{k}]: {name}",
-                        f"[{k}]: class: {class_name}.{name}",
-                    )
-            response = response[:-1]
-        for i in range(self._max_context):
-            response = response.replace(f"([{i+1}])", f"[{i+1}]")
-        return response
-
     def query(self, query: str) -> str:
         """queries the database for the given query
 
@@ -275,14 +650,15 @@ class Orchestrator:
         :return: response from the model
         :rtype: str
         """
-        template = "CONTEXT:\n{context}\nQUESTION: {query}\nANSWER:\n"
         vec = self._generate_embedding(query)
         results = self._db.run_similarity(vec)
-        context = self._create_context_string(results)
+        self._summarize_hits(results)
+        context = create_context_string(results, self._max_context)
         response = self._model_handler.invoke(
-            template.format(context=context, query=query),
+            QA_TEMPLATE.format(context=context, query=query),
             sys_msg=QA_SYSTEM_PROMPT,
         )
         self._model_handler.clear_messages()
-        response = self._reformat(response, results)
+        paths = {k: self._get_filepath(results[k]) for k in find_citations(response, results)}
+        response = reformat(response, results, paths, self._max_context)
         return response
@@ -1 +1,3 @@
-from .db import dbHandler
+from .async_db import asyncDbHandler
+from .db import dbHandler, schema_name
+from .snapshot import export_snapshot, import_snapshot
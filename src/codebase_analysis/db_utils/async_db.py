@@ -0,0 +1,180 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+import asyncpg
+
+from codebase_analysis.db_utils.db import decode_vector, encode_vector
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """sends and receives vectors in pgvector's binary format on a new pooled connection
+
+    :param conn: new connection
+    :type conn: asyncpg.Connection
+    """
+    schema = await conn.fetchval(
+        "SELECT typnamespace::regnamespace::text FROM pg_type WHERE typname = 'vector';"
+    )
+    await conn.set_type_codec(
+        "vector", schema=schema, encoder=encode_vector, decoder=decode_vector, format="binary"
+    )
+
+
+class asyncDbHandler:
+    """asyncio database handler for the query path; uses a connection pool so that the similarity
+    searches and lookups of concurrent requests can run in parallel
+
+    Table creation and data loading stay with dbHandler, this handler only reads. Vectors travel in
+    pgvector's binary format, and asyncpg prepares each statement once per connection.
+    """
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        schema: str = None,
+    ):
+        """initialize the async database handler with the given configuration.
+
+        :param config: database config
+        :type config: Dict[str, Any]
+        :param min_size: minimum number of pooled connections, defaults to 1
+        :type min_size: int, optional
+        :param max_size: maximum number of pooled connections, defaults to 10
+        :type max_size: int, optional
+        :param schema: schema holding the tables (one per repo), defaults to None (public)
+        :type schema: str, optional
+        """
+        self.config = config
+        self._schema = schema
+        self._min_size = min_size
+        self._max_size = max_size
+        self.pool = None
+
+    async def connect(self) -> None:
+        """create the connection pool to the PostgreSQL database"""
+        server_settings = None
+        if self._schema is not None:
+            server_settings = {"search_path": f"{self._schema}, public"}
+        self.pool = await asyncpg.create_pool(
+            database=self.config["name"],
+            user=self.config["user"],
+            password=self.config["password"],
+            host=self.config["host"],
+            port=self.config["port"],
+            min_size=self._min_size,
+            max_size=self._max_size,
+            server_settings=server_settings,
+            init=_init_connection,
+        )
+
+    async def close(self) -> None:
+        """close the connection pool"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _query_sim(self, table: str, vector: List[float]) -> List[Any]:
+        """query the database for similar items based on the given vector
+
+        :param table: table to query
+        :type table: str
+        :param vector: embedding vector to search for
+        :type vector: List[float]
+        :return: list of similar items
+        :rtype: List[Any]
+        """
+        query = f"""
+            SELECT id, name, code, summary, summarized, (embedding <=> $1::vector) AS distance
+            FROM {table}
+            WHERE (embedding <=> $1::vector) <= 0.5
+            ORDER BY distance
+            LIMIT 3;
+        """
+        try:
+            return await self.pool.fetch(query, vector)
+        except (asyncpg.PostgresError, OSError) as e:
+            print(f"Error executing query: {e}")
+            return []
+
+    async def run_similarity(self, vector: List[float]) -> Dict[str, Dict[str, Any]]:
+        """finds most similar functions, classes, and methods to the given vector; the three tables
+        are searched concurrently
+
+        :param vector: embedding vector to search for
+        :type vector: List[float]
+        :return: dictionary of results with their ids, names, code, and summary
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        types = ["functions", "classes", "methods"]
+        rows = await asyncio.gather(*[self._query_sim(_type, vector) for _type in types])
+        results = {}
+        for _type, temp in zip(types, rows):
+            for row in temp:
+                results[f"{_type}_{row['id']}"] = {
+                    "id": row["id"],
+                    "name": row["name"],
+                    "code": row["code"],
+                    "summary": row["summary"],
+                    "summarized": row["summarized"],
+                    "cos_dist": row["distance"],
+                    "type": _type,
+                }
+        return results
+
+    async def get_filepath(self, _type: str, _id: int) -> Tuple[str, str]:
+        """gets the file path (and potentially parent class name) of a function, class, or method
+
+        :param _type: table the item belongs to
+        :type _type: str
+        :param _id: id of the item
+        :type _id: int
+        :return: file path and parent class name (None unless the item is a method)
+        :rtype: Tuple[str, str]
+        """
+        if _type != "methods":
+            query = f"""SELECT files.path, NULL
+            FROM files
+            INNER JOIN {_type} ON {_type}.file_id = files.id
+            WHERE {_type}.id = $1;
+            """
+        else:
+            query = """SELECT files.path, classes.name
+            FROM files
+            INNER JOIN classes ON classes.file_id = files.id
+            INNER JOIN methods ON methods.class_id = classes.id
+            WHERE methods.id = $1;
+            """
+        row = await self.pool.fetchrow(query, _id)
+        return row[0], row[1]
+
+    async def update_summary(
+        self, table: str, _id: int, summary: str, embedding: List[float], code_hash: str = None
+    ) -> None:
+        """replaces the provisional summary and embedding of an item, and of the pending items of
+        the same table sharing its code, with its LLM summary
+
+        :param table: table of the item
+        :type table: str
+        :param _id: id of the item
+        :type _id: int
+        :param summary: summary
+        :type summary: str
+        :param embedding: embedding of the summary
+        :type embedding: List[float]
+        :param code_hash: normalized code hash of the item (see `hash_code`), defaults to None (only
+            the item itself is updated)
+        :type code_hash: str, optional
+        """
+        try:
+            await self.pool.execute(
+                f"UPDATE {table} SET summary = $1, embedding = $2::vector, summarized = TRUE "
+                "WHERE id = $3 OR (code_hash = $4 AND NOT summarized);",
+                summary,
+                embedding,
+                _id,
+                code_hash,
+            )
+        except (asyncpg.PostgresError, OSError) as e:
+            print(f"Error updating {table}: {e}")
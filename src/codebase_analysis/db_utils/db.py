@@ -1,7 +1,15 @@
-from typing import Any, Dict, List, Tuple
+import io
+import os
+import re
+import struct
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Sequence, Tuple, Union
 
+import numpy as np
 import psycopg2
 
+from codebase_analysis.file_utils import Entity, hash_code
+
 TABLES = {
     "files": """CREATE TABLE IF NOT EXISTS files (
         id SERIAL PRIMARY KEY,
@@ -14,6 +22,8 @@ TABLES = {
         code TEXT NOT NULL,
         summary TEXT,
         embedding VECTOR(),
+        summarized BOOLEAN NOT NULL DEFAULT TRUE,
+        code_hash TEXT,
         FOREIGN KEY (file_id) REFERENCES files(id)
     );""",
     "classes": """CREATE TABLE IF NOT EXISTS classes (
@@ -23,6 +33,8 @@ TABLES = {
         code TEXT NOT NULL,
         summary TEXT,
         embedding VECTOR(),
+        summarized BOOLEAN NOT NULL DEFAULT TRUE,
+        code_hash TEXT,
         FOREIGN KEY (file_id) REFERENCES files(id)
     );""",
     "methods": """CREATE TABLE IF NOT EXISTS methods (
@@ -32,15 +44,144 @@ TABLES = {
         code TEXT NOT NULL,
         summary TEXT,
         embedding VECTOR(),
+        summarized BOOLEAN NOT NULL DEFAULT TRUE,
+        code_hash TEXT,
         FOREIGN KEY (class_id) REFERENCES classes(id)
     );""",
 }
 
 
+def schema_name(repo_path: str) -> str:
+    """derives the PostgreSQL schema used to store a repo from its path; clones made by
+    `download_repo` are named by `repo_key`, so different repos never share a schema
+
+    :param repo_path: path to the repo
+    :type repo_path: str
+    :return: schema name
+    :rtype: str
+    """
+    name = re.sub(r"\W", "_", os.path.basename(os.path.normpath(repo_path)).lower())
+    return f"repo_{name}"
+
+
+def to_list(vector: Union[np.ndarray, List[float]]) -> List[float]:
+    """converts an embedding to the list of floats psycopg2 can adapt
+
+    :param vector: embedding vector
+    :type vector: Union[np.ndarray, List[float]]
+    :return: embedding as a list
+    :rtype: List[float]
+    """
+    if isinstance(vector, np.ndarray):
+        return vector.tolist()
+    return vector
+
+
+def vector_literal(vector: Union[np.ndarray, List[float]]) -> str:
+    """renders an embedding as a compact pgvector text literal; 9 significant digits are enough to
+    round-trip float32 values exactly
+
+    :param vector: embedding vector
+    :type vector: Union[np.ndarray, List[float]]
+    :return: literal such as "[0.125,-1.5]"
+    :rtype: str
+    """
+    return "[" + ",".join(map("{:.9g}".format, to_list(vector))) + "]"
+
+
+def encode_vector(vector: Union[np.ndarray, List[float]]) -> bytes:
+    """encodes an embedding in pgvector's binary format: dimension, unused, big-endian float4 values
+
+    :param vector: embedding vector
+    :type vector: Union[np.ndarray, List[float]]
+    :return: binary value
+    :rtype: bytes
+    """
+    vector = np.asarray(vector, dtype=">f4")
+    return struct.pack(">hh", len(vector), 0) + vector.tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """inverse of encode_vector
+
+    :param data: binary value
+    :type data: bytes
+    :return: embedding (float32)
+    :rtype: np.ndarray
+    """
+    dim, _ = struct.unpack_from(">hh", data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype(np.float32)
+
+
+# the three similarity searches as one statement, prepared once per connection; the query vector is
+# its only parameter, so it is sent (and parsed) once per question
+SIMILARITY_TABLES = ["functions", "classes", "methods"]
+SIMILARITY_QUERY = "\nUNION ALL\n".join(
+    f"""(SELECT '{table}' AS type, id, name, code, summary, summarized,
+        (embedding <=> $1) AS distance
+    FROM {table}
+    WHERE (embedding <=> $1) <= 0.5
+    ORDER BY distance
+    LIMIT 3)""" for table in SIMILARITY_TABLES
+)
+
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+
+
+def _encode_field(value: Any, kind: str) -> bytes:
+    """encodes a single field in the binary COPY format
+
+    :param value: field value
+    :type value: Any
+    :param kind: column type ("int4", "bool", "text", or "vector")
+    :type kind: str
+    :return: length-prefixed field
+    :rtype: bytes
+    """
+    if value is None:
+        return struct.pack(">i", -1)
+    if kind == "int4":
+        data = struct.pack(">i", int(value))
+    elif kind == "bool":
+        data = b"\x01" if value else b"\x00"
+    elif kind == "text":
+        data = value.encode("utf-8")
+    else:
+        data = encode_vector(value)
+    return struct.pack(">i", len(data)) + data
+
+
+def encode_copy_binary(rows: Sequence[Sequence[Any]], kinds: Sequence[str]) -> bytes:
+    """encodes rows in PostgreSQL's binary COPY format
+
+    :param rows: rows to encode
+    :type rows: Sequence[Sequence[Any]]
+    :param kinds: column types ("int4", "bool", "text", or "vector")
+    :type kinds: Sequence[str]
+    :return: COPY payload
+    :rtype: bytes
+    """
+    buffer = io.BytesIO()
+    buffer.write(COPY_BINARY_HEADER)
+    field_count = struct.pack(">h", len(kinds))
+    for row in rows:
+        buffer.write(field_count)
+        for value, kind in zip(row, kinds):
+            buffer.write(_encode_field(value, kind))
+    buffer.write(struct.pack(">h", -1))
+    return buffer.getvalue()
+
+
 class dbHandler:
     """Database handler class to manage database connections and operations"""
 
-    def __init__(self, config: Dict[str, Any], embedding_dim: int = 384, init: bool = True):
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        embedding_dim: int = 384,
+        init: bool = True,
+        schema: str = None,
+    ):
         """initialize the database handler with the given configuration.
 
         :param config: database config
@@ -49,13 +190,22 @@ class dbHandler:
         :type embedding_dim: int, optional
         :param init: whether to initialize the database, defaults to True
         :type init: bool, optional
+        :param schema: schema holding the tables (one per repo), defaults to None (public)
+        :type schema: str, optional
         """
         self.config = config
         self._embedding_dim = embedding_dim
+        self._schema = schema
         self.conn = None
         self.cursor = None
+        self._prepared = False
         self.connect(init=init)
 
+    @property
+    def embedding_dim(self) -> int:
+        """dimension of the stored embeddings"""
+        return self._embedding_dim
+
     def connect(self, init: bool):
         """establish a connection to the PostgreSQL database
 
@@ -72,7 +222,13 @@ class dbHandler:
                 port=self.config["port"],
             )
             self.cursor = self.conn.cursor()
+            # prepared statements belong to the session
+            self._prepared = False
             self.cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+            if self._schema is not None:
+                self.cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {self._schema};")
+                self.cursor.execute(f"SET search_path TO {self._schema}, public;")
+                self.conn.commit()
             if init:
                 self._create_tables()
                 self.clear()
@@ -86,20 +242,57 @@ class dbHandler:
                 self.cursor.execute(
                     create_statement.replace("VECTOR()", f"VECTOR({self._embedding_dim})")
                 )
+                if table_name != "files":
+                    # tables created before lazy indexing existed
+                    self.cursor.execute(
+                        f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS "
+                        "summarized BOOLEAN NOT NULL DEFAULT TRUE;"
+                    )
+                    self.cursor.execute(
+                        f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS code_hash TEXT;"
+                    )
+                    # copies of a code body are summarized together (see `update_summary`)
+                    self.cursor.execute(
+                        f"CREATE INDEX IF NOT EXISTS {table_name}_code_hash "
+                        f"ON {table_name} (code_hash);"
+                    )
                 self.conn.commit()
             except Exception as e:
                 print(f"Error creating table {table_name}: {e}")
 
-    def clear(self):
-        """clear all tables in the database."""
+    def clear(self, commit: bool = True):
+        """clear all tables in the database.
+
+        :param commit: whether to commit right away; otherwise the truncation joins the open
+            transaction (see `transaction`) and errors are raised, defaults to True
+        :type commit: bool, optional
+        """
         try:
             self.cursor.execute("TRUNCATE files CASCADE;")
-            self.conn.commit()
-            print("All tables cleared successfully.")
+            if commit:
+                self.conn.commit()
+                print("All tables cleared successfully.")
         except Exception as e:
+            if not commit:
+                raise
             # self.rollback()
             print("Error clearing tables:", e)
 
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """groups several statements (e.g. `clear` and `bulk_load` with commit=False) into one
+        transaction: it is committed at the end of the block and rolled back if anything raises
+
+        :return: context manager
+        :rtype: Iterator[None]
+        """
+        try:
+            yield
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
     def _add_file(self, path: str) -> int:
         """add a row to the files table
 
@@ -116,60 +309,87 @@ class dbHandler:
         except Exception as e:
             print(f"Error inserting into files: {e}")
 
-    def _process_functions(self, functions: Dict[str, Any], file_id: int) -> None:
+    def _process_functions(self, functions: Dict[str, Entity], file_id: int) -> None:
         """process functions to extract columns and values for insertion.
 
         :param functions: functions with their attributes
-        :type functions: Dict[str, Any]
+        :type functions: Dict[str, Entity]
         :param file_id: id of the file to which the functions belong
         :type file_id: int
         """
         for func, attrs in functions.items():
+            code = attrs.text
             try:
                 self.cursor.execute(
-                    f"INSERT INTO functions (file_id, name, code, summary, embedding) VALUES (%s, %s, %s, %s, %s);",
-                    (file_id, func, attrs["text"], attrs["summary"], attrs["embedding"]),
+                    f"INSERT INTO functions (file_id, name, code, summary, embedding, summarized, code_hash) VALUES (%s, %s, %s, %s, %s, %s, %s);",
+                    (
+                        file_id,
+                        func,
+                        code,
+                        attrs.summary,
+                        to_list(attrs.embedding),
+                        attrs.summarized,
+                        hash_code(code),
+                    ),
                 )
                 self.conn.commit()
             except Exception as e:
                 print(f"Error inserting into files: {e}")
 
-    def _process_methods(self, methods: Dict[str, Any], class_id: int) -> None:
+    def _process_methods(self, methods: Dict[str, Entity], class_id: int) -> None:
         """process functions to extract columns and values for insertion.
 
         :param methods: methods with their attributes
-        :type methods: Dict[str, Any]
+        :type methods: Dict[str, Entity]
         :param class_id: id of the class to which the functions belong
         :type class_id: int
         """
         for method, attrs in methods.items():
+            code = attrs.text
             try:
                 self.cursor.execute(
-                    f"INSERT INTO methods (class_id, name, code, summary, embedding) VALUES (%s, %s, %s, %s, %s);",
-                    (class_id, method, attrs["text"], attrs["summary"], attrs["embedding"]),
+                    f"INSERT INTO methods (class_id, name, code, summary, embedding, summarized, code_hash) VALUES (%s, %s, %s, %s, %s, %s, %s);",
+                    (
+                        class_id,
+                        method,
+                        code,
+                        attrs.summary,
+                        to_list(attrs.embedding),
+                        attrs.summarized,
+                        hash_code(code),
+                    ),
                 )
                 self.conn.commit()
             except Exception as e:
                 print(f"Error inserting into files: {e}")
 
-    def _process_classes(self, classes: Dict[str, Any], file_id: int) -> None:
+    def _process_classes(self, classes: Dict[str, Entity], file_id: int) -> None:
         """process functions to extract columns and values for insertion.
 
         :param classes: classes with their attributes
-        :type classes: Dict[str, Any]
+        :type classes: Dict[str, Entity]
         :param file_id: id of the file to which the functions belong
         :type file_id: int
         """
         for _class, attrs in classes.items():
+            code = attrs.text
             try:
                 self.cursor.execute(
-                    f"INSERT INTO classes (file_id, name, code, summary, embedding) VALUES (%s, %s, %s, %s, %s) RETURNING id;",
-                    (file_id, _class, attrs["text"], attrs["summary"], attrs["embedding"]),
+                    f"INSERT INTO classes (file_id, name, code, summary, embedding, summarized, code_hash) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;",
+                    (
+                        file_id,
+                        _class,
+                        code,
+                        attrs.summary,
+                        to_list(attrs.embedding),
+                        attrs.summarized,
+                        hash_code(code),
+                    ),
                 )
                 _id = self.cursor.fetchone()[0]
                 self.conn.commit()
                 self._process_methods(
-                    attrs["methods"],
+                    attrs.methods,
                     _id,
                 )
             except Exception as e:
@@ -187,29 +407,168 @@ class dbHandler:
         self._process_functions(breakdown["functions"], file_id)
         self._process_classes(breakdown["classes"], file_id)
 
-    def _query_sim(self, table: str, vector: List[float]) -> List[Any]:
-        """query the database for similar items based on the given vector
+    def get_unsummarized(self) -> List[Tuple[str, int]]:
+        """lists the functions, classes, and methods still waiting for an LLM summary
 
-        :param table: table to query
-        :type table: str
-        :param vector: embedding vector to search for
-        :type vector: List[float]
-        :return: list of similar items
-        :rtype: List[Any]
+        :return: table and id of each pending item
+        :rtype: List[Tuple[str, int]]
         """
-        query = f"""
-            SELECT *, (embedding <=> %s::vector) AS distance FROM {table}
-            WHERE (embedding <=> %s::vector) <= 0.5
-            ORDER BY distance
-            LIMIT 3;
+        pending = []
+        for table in ["functions", "classes", "methods"]:
+            rows = self.run_basic_query(f"SELECT id FROM {table} WHERE NOT summarized ORDER BY id;")
+            pending += [(table, row[0]) for row in rows]
+        return pending
+
+    def get_item(self, table: str, _id: int) -> Tuple[str, str, bool]:
+        """gets the code and summary of a function, class, or method
+
+        :param table: table of the item
+        :type table: str
+        :param _id: id of the item
+        :type _id: int
+        :return: code, summary, and whether the summary comes from the LLM; None if the item does not exist
+        :rtype: Tuple[str, str, bool]
         """
         try:
-            self.cursor.execute(query, (vector, vector))
-            result = self.cursor.fetchall()
-            return result
+            self.cursor.execute(
+                f"SELECT code, summary, summarized FROM {table} WHERE id = %s;", (_id,)
+            )
+            row = self.cursor.fetchone()
+            self.conn.commit()
+            return row
         except Exception as e:
+            self.conn.rollback()
             print(f"Error executing query: {e}")
-            return []
+            return None
+
+    def update_summary(
+        self,
+        table: str,
+        _id: int,
+        summary: str,
+        embedding: Union[np.ndarray, List[float]],
+        code_hash: str = None,
+    ) -> None:
+        """replaces the provisional summary and embedding of an item, and of the pending items of
+        the same table sharing its code, with its LLM summary
+
+        :param table: table of the item
+        :type table: str
+        :param _id: id of the item
+        :type _id: int
+        :param summary: summary
+        :type summary: str
+        :param embedding: embedding of the summary
+        :type embedding: Union[np.ndarray, List[float]]
+        :param code_hash: normalized code hash of the item (see `hash_code`), defaults to None (only
+            the item itself is updated)
+        :type code_hash: str, optional
+        """
+        try:
+            self.cursor.execute(
+                f"UPDATE {table} SET summary = %s, embedding = %s, summarized = TRUE "
+                "WHERE id = %s OR (code_hash = %s AND NOT summarized);",
+                (summary, to_list(embedding), _id, code_hash),
+            )
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"Error updating {table}: {e}")
+
+    def dump_files(self) -> Tuple[List[int], List[str]]:
+        """reads the files table
+
+        :return: ids and paths of the files
+        :rtype: Tuple[List[int], List[str]]
+        """
+        rows = self.run_basic_query("SELECT id, path FROM files ORDER BY id;")
+        return [row[0] for row in rows], [row[1] for row in rows]
+
+    def dump_table(self, table: str, batch_size: int = 1000) -> Dict[str, Any]:
+        """reads a functions, classes, or methods table, streaming the rows from the server
+
+        :param table: table to read
+        :type table: str
+        :param batch_size: rows fetched per round trip, defaults to 1000
+        :type batch_size: int, optional
+        :return: "id", "parent_id" (file or class id), "name", "code", "summary", and "summarized"
+            lists, and the "embedding" matrix (float32, one row per item)
+        :rtype: Dict[str, Any]
+        """
+        parent = "class_id" if table == "methods" else "file_id"
+        count = self.run_basic_query(f"SELECT count(*) FROM {table};")[0][0]
+        columns = {
+            "id": [],
+            "parent_id": [],
+            "name": [],
+            "code": [],
+            "summary": [],
+            "summarized": [],
+        }
+        embeddings = np.zeros((count, self._embedding_dim), dtype=np.float32)
+        with self.conn.cursor(name=f"dump_{table}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(
+                f"SELECT id, {parent}, name, code, summary, summarized, embedding::text "
+                f"FROM {table} ORDER BY id;"
+            )
+            for i, row in enumerate(cursor):
+                for key, value in zip(columns, row):
+                    columns[key].append(value)
+                if row[6] is not None:
+                    embeddings[i] = np.array(row[6][1:-1].split(","), dtype=np.float32)
+        self.conn.commit()
+        columns["embedding"] = embeddings
+        return columns
+
+    def bulk_load(
+        self,
+        table: str,
+        columns: Sequence[str],
+        kinds: Sequence[str],
+        rows: Sequence[Sequence[Any]],
+        commit: bool = True,
+    ) -> None:
+        """loads rows with a single binary COPY and moves the id sequence past the loaded ids
+
+        :param table: table to load into
+        :type table: str
+        :param columns: columns of the rows
+        :type columns: Sequence[str]
+        :param kinds: column types ("int4", "bool", "text", or "vector")
+        :type kinds: Sequence[str]
+        :param rows: rows to load
+        :type rows: Sequence[Sequence[Any]]
+        :param commit: whether to commit right away; otherwise the load joins the open transaction
+            (see `transaction`), defaults to True
+        :type commit: bool, optional
+        :raises psycopg2.Error: if the load fails (the transaction is rolled back when committing)
+        """
+        payload = io.BytesIO(encode_copy_binary(rows, kinds))
+        try:
+            self.cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary);", payload
+            )
+            self.cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false);"
+            )
+            if commit:
+                self.conn.commit()
+        except Exception:
+            if commit:
+                self.conn.rollback()
+            raise
+
+    def _prepare_similarity(self) -> None:
+        """prepares the similarity statement on this connection (once), so that each question only
+        binds the vector instead of sending, parsing, and planning three statements
+        """
+        if self._prepared:
+            return
+        self.cursor.execute(f"PREPARE similarity (vector) AS\n{SIMILARITY_QUERY};")
+        self.conn.commit()
+        self._prepared = True
 
     def run_similarity(self, vector: List[float]) -> Dict[int, Dict[str, str]]:
         """finds most similar functions, classes, and methods to the given vector
@@ -219,18 +578,26 @@ class dbHandler:
         :return: dictionary of results with their ids, names, code, and summary
         :rtype: Dict[int, Dict[str, str]]
         """
+        try:
+            self._prepare_similarity()
+            self.cursor.execute("EXECUTE similarity (%s);", (vector_literal(vector),))
+            rows = self.cursor.fetchall()
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"Error executing query: {e}")
+            return {}
         results = {}
-        for _type in ["functions", "classes", "methods"]:
-            temp = self._query_sim(_type, vector)
-            for row in temp:
-                results[f"{_type}_{row[0]}"] = {
-                    "id": row[0],
-                    "name": row[2],
-                    "code": row[3],
-                    "summary": row[4],
-                    "cos_dist": row[6],
-                    "type": _type,
-                }
+        for row in rows:
+            results[f"{row[0]}_{row[1]}"] = {
+                "id": row[1],
+                "name": row[2],
+                "code": row[3],
+                "summary": row[4],
+                "summarized": row[5],
+                "cos_dist": row[6],
+                "type": row[0],
+            }
         return results
 
     def run_basic_query(self, query: str) -> List[Any]:
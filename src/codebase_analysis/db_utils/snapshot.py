@@ -0,0 +1,161 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from codebase_analysis.db_utils.db import dbHandler
+from codebase_analysis.file_utils import hash_code
+
+SNAPSHOT_VERSION = 2
+
+ENTITY_TABLES = ["functions", "classes", "methods"]
+
+
+def _pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """packs strings into one UTF-8 buffer and their offsets (avoids pickled object arrays)
+
+    :param strings: strings to pack (None is stored as an empty string)
+    :type strings: List[str]
+    :return: UTF-8 buffer and the n + 1 offsets delimiting each string
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    encoded = [(string or "").encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """inverse of _pack_strings
+
+    :param data: UTF-8 buffer
+    :type data: np.ndarray
+    :param offsets: offsets delimiting each string
+    :type offsets: np.ndarray
+    :return: unpacked strings
+    :rtype: List[str]
+    """
+    buffer = data.tobytes()
+    bounds = offsets.tolist()
+    return [buffer[start:end].decode("utf-8") for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def export_snapshot(db: dbHandler, path: str) -> Dict[str, int]:
+    """exports an indexed repo (files, functions, classes, methods, summaries, embeddings, and code
+    hashes) to a compressed .npz file
+
+    :param db: handler connected to the repo's schema
+    :type db: dbHandler
+    :param path: destination file (".npz" is appended by numpy if missing)
+    :type path: str
+    :return: number of exported rows per table
+    :rtype: Dict[str, int]
+    """
+    arrays = {}
+    file_ids, file_paths = db.dump_files()
+    arrays["files_id"] = np.array(file_ids, dtype=np.int64)
+    arrays["files_path_data"], arrays["files_path_offsets"] = _pack_strings(file_paths)
+    counts = {"files": len(file_ids)}
+    for table in ENTITY_TABLES:
+        columns = db.dump_table(table)
+        arrays[f"{table}_id"] = np.array(columns["id"], dtype=np.int64)
+        arrays[f"{table}_parent_id"] = np.array(columns["parent_id"], dtype=np.int64)
+        arrays[f"{table}_embedding"] = columns["embedding"]
+        arrays[f"{table}_summarized"] = np.array(columns["summarized"], dtype=bool)
+        columns["hash"] = [hash_code(code) for code in columns["code"]]
+        for key in ["name", "code", "summary", "hash"]:
+            data, offsets = _pack_strings(columns[key])
+            arrays[f"{table}_{key}_data"], arrays[f"{table}_{key}_offsets"] = data, offsets
+        counts[table] = len(columns["id"])
+    np.savez_compressed(
+        path,
+        version=np.array(SNAPSHOT_VERSION),
+        embedding_dim=np.array(db.embedding_dim),
+        **arrays,
+    )
+    return counts
+
+
+def import_snapshot(db: dbHandler, path: str) -> Dict[str, int]:
+    """loads a snapshot written by export_snapshot into the (cleared) repo schema with one binary
+    COPY per table; ids are kept so the file and class references stay valid
+
+    The clearing and the four loads run in one transaction, so a failed import leaves the schema as
+    it was.
+
+    :param db: handler connected to the repo's schema
+    :type db: dbHandler
+    :param path: snapshot file
+    :type path: str
+    :raises ValueError: if the snapshot version or embedding dimension does not match
+    :raises psycopg2.Error: if loading fails (nothing is imported)
+    :return: number of imported rows per table
+    :rtype: Dict[str, int]
+    """
+    with np.load(path) as snapshot:
+        # version 1 snapshots predate lazy indexing, so everything in them is summarized
+        if int(snapshot["version"]) not in (1, SNAPSHOT_VERSION):
+            raise ValueError(f"Unsupported snapshot version {int(snapshot['version'])}")
+        if int(snapshot["embedding_dim"]) != db.embedding_dim:
+            raise ValueError(
+                f"Snapshot embedding dimension {int(snapshot['embedding_dim'])} does not match "
+                f"the configured {db.embedding_dim}"
+            )
+        with db.transaction():
+            db.clear(commit=False)
+            file_paths = _unpack_strings(
+                snapshot["files_path_data"], snapshot["files_path_offsets"]
+            )
+            db.bulk_load(
+                "files",
+                ["id", "path"],
+                ["int4", "text"],
+                list(zip(snapshot["files_id"].tolist(), file_paths)),
+                commit=False,
+            )
+            counts = {"files": len(file_paths)}
+            for table in ENTITY_TABLES:
+                parent = "class_id" if table == "methods" else "file_id"
+                names, code, summaries = [
+                    _unpack_strings(
+                        snapshot[f"{table}_{key}_data"], snapshot[f"{table}_{key}_offsets"]
+                    )
+                    for key in ["name", "code", "summary"]
+                ]
+                ids = snapshot[f"{table}_id"].tolist()
+                summarized = [True] * len(ids)
+                if f"{table}_summarized" in snapshot:
+                    summarized = snapshot[f"{table}_summarized"].tolist()
+                if f"{table}_hash_data" in snapshot:
+                    hashes = _unpack_strings(
+                        snapshot[f"{table}_hash_data"], snapshot[f"{table}_hash_offsets"]
+                    )
+                else:
+                    hashes = [hash_code(c) for c in code]
+                rows = zip(
+                    ids,
+                    snapshot[f"{table}_parent_id"].tolist(),
+                    names,
+                    code,
+                    summaries,
+                    snapshot[f"{table}_embedding"].astype(">f4"),
+                    summarized,
+                    hashes,
+                )
+                db.bulk_load(
+                    table,
+                    [
+                        "id",
+                        parent,
+                        "name",
+                        "code",
+                        "summary",
+                        "embedding",
+                        "summarized",
+                        "code_hash",
+                    ],
+                    ["int4", "int4", "text", "text", "text", "vector", "bool", "text"],
+                    list(rows),
+                    commit=False,
+                )
+                counts[table] = len(names)
+    return counts
@@ -1,3 +1,7 @@
-from .breakdown import get_all_files
-from .download import download_repo
-from .read import find_classes, find_funcs
\ No newline at end of file
+from .breakdown import get_all_files, select_files
+from .dedup import hash_code, normalize_code
+from .download import download_repo, repo_key
+from .entity import Entity, open_source
+from .read import find_classes, find_entities, find_funcs
+from .signals import ENTITY_LABELS, describe_entity, get_docstring, get_signature
+from .tiers import TRIVIAL_TIERS, classify_entity
@@ -1,5 +1,43 @@
+import os
+import re
+from fnmatch import fnmatch
 from glob import glob
-from typing import List
+from typing import Dict, List, Tuple
+
+import git
+
+# path patterns (matched against "/" + the path relative to the repo) of vendored or generated code
+VENDORED_PATTERNS = [
+    "*/site-packages/*",
+    "*/dist-packages/*",
+    "*/venv/*",
+    "*/.venv/*",
+    "*/virtualenv/*",
+    "*/node_modules/*",
+    "*/vendor/*",
+    "*/vendored/*",
+    "*/_vendor/*",
+    "*/third_party/*",
+    "*/thirdparty/*",
+    # build output sits at the root; packages deeper down may well be named build or dist
+    "/build/*",
+    "/dist/*",
+    "*/.eggs/*",
+    "*/.tox/*",
+    "*/.nox/*",
+    "*/migrations/*",
+    "*_pb2.py",
+    "*_pb2_grpc.py",
+]
+
+# headers written by code generators, matched against the (lowercased) comments in the first lines
+# of a file
+GENERATED_MARKERS = [
+    re.compile(r"@generated\b"),
+    re.compile(r"\bdo not edit\b"),
+    re.compile(r"generated by the protocol buffer compiler"),
+    re.compile(r"\b(autogenerated|auto-generated|automatically generated) by\b"),
+]
 
 
 def get_all_files(path: str, file_type: str = ".py") -> List[str]:
@@ -15,6 +53,157 @@ def get_all_files(path: str, file_type: str = ".py") -> List[str]:
     return glob(f"{path}/**/*{file_type}", recursive=True)
 
 
+def _find_virtualenvs(path: str) -> List[str]:
+    """finds checked-in virtual environments (directories containing a pyvenv.cfg)
+
+    :param path: path to the directory
+    :type path: str
+    :return: relative paths of the virtual environments
+    :rtype: List[str]
+    """
+    configs = glob(f"{path}/**/pyvenv.cfg", recursive=True)
+    return [
+        os.path.relpath(os.path.dirname(config), path).replace(os.sep, "/") for config in configs
+    ]
+
+
+def _find_gitignored(path: str, files: List[str], chunk_size: int = 1000) -> List[str]:
+    """finds the files matched by the repo's .gitignore rules, including files that are checked in
+    anyway (e.g. a committed virtual environment)
+
+    :param path: path to the repo
+    :type path: str
+    :param files: relative paths of the files to check
+    :type files: List[str]
+    :param chunk_size: number of files checked per git call, defaults to 1000
+    :type chunk_size: int, optional
+    :return: relative paths of the ignored files
+    :rtype: List[str]
+    """
+    try:
+        repo = git.Repo(path)
+    except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+        return []
+    ignored = []
+    for i in range(0, len(files), chunk_size):
+        try:
+            # --no-index: plain check-ignore never reports tracked files
+            output = repo.git.check_ignore("--no-index", *files[i : i + chunk_size])
+        except git.exc.GitCommandError as e:
+            # exit code 1 means none of the files are ignored
+            if e.status != 1:
+                raise
+            continue
+        ignored += output.splitlines()
+    return ignored
+
+
+def _is_generated(path: str, header_lines: int = 5) -> bool:
+    """checks the comments in the first lines of a file for the header of a code generator
+
+    :param path: path to the file
+    :type path: str
+    :param header_lines: number of lines to check, defaults to 5
+    :type header_lines: int, optional
+    :return: whether the file is generated
+    :rtype: bool
+    """
+    with open(path, "r", errors="replace") as f:
+        for _ in range(header_lines):
+            line = f.readline().strip().lower()
+            if line.startswith("#") and any(marker.search(line) for marker in GENERATED_MARKERS):
+                return True
+    return False
+
+
+def _count_lines(path: str) -> int:
+    """counts the lines of a file
+
+    :param path: path to the file
+    :type path: str
+    :return: number of lines
+    :rtype: int
+    """
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def select_files(
+    path: str,
+    file_type: str = ".py",
+    include: List[str] = None,
+    exclude: List[str] = None,
+    skip_vendored: bool = True,
+    respect_gitignore: bool = True,
+    max_file_kb: float = None,
+    max_file_lines: int = None,
+) -> Tuple[List[str], Dict[str, str]]:
+    """returns the files of a directory worth indexing, along with the files skipped and why
+
+    Glob patterns are matched against the path relative to the directory.
+
+    :param path: path to the directory
+    :type path: str
+    :param file_type: file extension to search for, defaults to ".py"
+    :type file_type: str, optional
+    :param include: patterns a file must match to be kept, defaults to None (keep all)
+    :type include: List[str], optional
+    :param exclude: patterns of files to skip, defaults to None
+    :type exclude: List[str], optional
+    :param skip_vendored: whether to skip virtual environments, vendored, and generated code, defaults to True
+    :type skip_vendored: bool, optional
+    :param respect_gitignore: whether to skip files matched by .gitignore (even if checked in), defaults to True
+    :type respect_gitignore: bool, optional
+    :param max_file_kb: size above which files are skipped, defaults to None (no limit)
+    :type max_file_kb: float, optional
+    :param max_file_lines: line count above which files are skipped, defaults to None (no limit)
+    :type max_file_lines: int, optional
+    :return: selected filepaths and skipped filepaths mapped to the reason ("<category>: <detail>")
+    :rtype: Tuple[List[str], Dict[str, str]]
+    """
+    files = get_all_files(path, file_type)
+    relpaths = {file: os.path.relpath(file, path).replace(os.sep, "/") for file in files}
+    virtualenvs = _find_virtualenvs(path) if skip_vendored else []
+    skipped = {}
+    candidates = []
+    for file in files:
+        rel = relpaths[file]
+        if include and not any(fnmatch(rel, pattern) for pattern in include):
+            skipped[file] = "not included: no include pattern matches"
+            continue
+        pattern = next((p for p in exclude or [] if fnmatch(rel, p)), None)
+        if pattern is not None:
+            skipped[file] = f"excluded: {pattern}"
+            continue
+        if skip_vendored:
+            venv = next((v for v in virtualenvs if rel.startswith(f"{v}/") or v == "."), None)
+            if venv is not None:
+                skipped[file] = f"vendored: virtual environment {venv}"
+                continue
+            pattern = next((p for p in VENDORED_PATTERNS if fnmatch(f"/{rel}", p)), None)
+            if pattern is not None:
+                skipped[file] = f"vendored: {pattern}"
+                continue
+        candidates.append(file)
+    if respect_gitignore:
+        ignored = set(_find_gitignored(path, [relpaths[file] for file in candidates]))
+        for file in candidates:
+            if relpaths[file] in ignored:
+                skipped[file] = "gitignored: .gitignore"
+        candidates = [file for file in candidates if file not in skipped]
+    selected = []
+    for file in candidates:
+        if max_file_kb is not None and os.path.getsize(file) > max_file_kb * 1024:
+            skipped[file] = f"too large: over {max_file_kb} KB"
+        elif max_file_lines is not None and _count_lines(file) > max_file_lines:
+            skipped[file] = f"too large: over {max_file_lines} lines"
+        elif skip_vendored and _is_generated(file):
+            skipped[file] = "generated: header marker"
+        else:
+            selected.append(file)
+    return selected, skipped
+
+
 if __name__ == "__main__":
     path = "/coding-projects/llm-sheet-analysis"
     file_type = ".py"
@@ -0,0 +1,35 @@
+import hashlib
+import re
+import textwrap
+
+
+def normalize_code(code: str) -> str:
+    """normalizes code so that copies differing only in whitespace compare equal
+
+    Common indentation is removed, whitespace runs after the (meaningful) leading indentation are
+    collapsed, trailing whitespace is stripped, and blank lines are dropped.
+
+    :param code: code to normalize
+    :type code: str
+    :return: normalized code
+    :rtype: str
+    """
+    normalized = []
+    for line in textwrap.dedent(code).split("\n"):
+        body = line.lstrip()
+        if len(body) == 0:
+            continue
+        indent = line[: len(line) - len(body)]
+        normalized.append(indent + re.sub(r"\s+", " ", body.rstrip()))
+    return "\n".join(normalized)
+
+
+def hash_code(code: str) -> str:
+    """hashes the normalized code
+
+    :param code: code to hash
+    :type code: str
+    :return: hex digest of the normalized code
+    :rtype: str
+    """
+    return hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
@@ -1,6 +1,31 @@
+import hashlib
+import re
+
 import git
 
 
+def repo_key(repo_url: str) -> str:
+    """derives a collision-free key for a repo from its URL, used for its clone directory and (via
+    `schema_name`) its database schema
+
+    URLs differing only in scheme, case, a trailing slash, or ".git" give the same key; different
+    repos with the same name (e.g. a/utils and b/utils) do not.
+
+    :param repo_url: URL of the repo
+    :type repo_url: str
+    :return: "<owner>_<repo>_<hash>" in lowercase letters, digits, and underscores (at most 58
+        characters, so the schema name fits PostgreSQL's 63-character limit)
+    :rtype: str
+    """
+    url = repo_url.strip().rstrip("/").lower()
+    if url.endswith(".git"):
+        url = url[: -len(".git")]
+    url = re.sub(r"^[a-z+]+://", "", url)
+    url = re.sub(r"^(git@|www\.)", "", url).replace(":", "/", 1)
+    name = re.sub(r"\W", "_", "_".join(url.split("/")[-2:]))[:49]
+    return f"{name}_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}"
+
+
 def download_repo(repo_url: str) -> None:
     """
     Downloads the repository from GitLab.
@@ -8,13 +33,13 @@ def download_repo(repo_url: str) -> None:
     # Clone the repository
     if not repo_url.endswith(".git"):
         repo_url += ".git"
-    repo_name = repo_url.split("/")[-1].split(".git")[0]
+    repo_dir = f"/workspace/tmp/{repo_key(repo_url)}"
     # check if the repo already exists
     try:
-        git.Repo(f"/workspace/tmp/{repo_name}")
+        git.Repo(repo_dir)
     except:
-        git.Repo.clone_from(repo_url, f"/workspace/tmp/{repo_name}")
-    return f"/workspace/tmp/{repo_name}"
+        git.Repo.clone_from(repo_url, repo_dir)
+    return repo_dir
 
 
 if __name__ == "__main__":
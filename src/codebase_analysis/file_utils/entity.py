@@ -0,0 +1,83 @@
+import mmap
+from functools import lru_cache
+from typing import Dict
+
+import numpy as np
+
+
+@lru_cache(maxsize=64)
+def open_source(path: str) -> mmap.mmap:
+    """memory-maps a source file read-only; the most recently used maps are kept open
+
+    :param path: path to the file
+    :type path: str
+    :return: memory map of the file, None if the file is empty
+    :rtype: mmap.mmap
+    """
+    with open(path, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return None
+
+
+def decode_line(line: bytes) -> str:
+    """decodes a raw source line the way text-mode reading would (universal newlines)
+
+    :param line: raw line, including its line ending
+    :type line: bytes
+    :return: decoded line ending in "\\n" (unless it is the unterminated last line)
+    :rtype: str
+    """
+    text = line.decode("utf-8", errors="replace")
+    if text.endswith("\r\n"):
+        text = text[:-2] + "\n"
+    elif text.endswith("\r"):
+        text = text[:-1] + "\n"
+    return text
+
+
+class Entity:
+    """a function, class, or method found in a source file
+
+    Only the byte span of the code in its (memory-mapped) file is stored; the text is read back when
+    a stage needs it. Methods of a class are spans inside the class span, so no code is copied.
+    """
+
+    __slots__ = ("path", "start", "end", "summary", "embedding", "summarized", "methods")
+
+    def __init__(self, path: str, start: int, end: int, methods: Dict[str, "Entity"] = None):
+        """initializes Entity
+
+        :param path: path to the source file
+        :type path: str
+        :param start: byte offset of the first line of the code
+        :type start: int
+        :param end: byte offset just past the last line of the code
+        :type end: int
+        :param methods: methods of the entity if it is a class, defaults to None
+        :type methods: Dict[str, Entity], optional
+        """
+        self.path = path
+        self.start = start
+        self.end = end
+        self.methods = methods
+        self.summary: str = None
+        self.embedding: np.ndarray = None
+        # False while the summary only holds the cheap signals (see describe_entity)
+        self.summarized = False
+
+    @property
+    def text(self) -> str:
+        """code of the entity, without blank lines
+
+        :return: code
+        :rtype: str
+        """
+        source = open_source(self.path)
+        lines = source[self.start : self.end].splitlines(keepends=True)
+        return "".join(line for line in map(decode_line, lines) if line != "\n")
+
+    def __repr__(self) -> str:
+        return f"Entity(path={self.path!r}, start={self.start}, end={self.end})"
@@ -1,5 +1,7 @@
 import re
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+from codebase_analysis.file_utils.entity import Entity, decode_line, open_source
 
 
 def find_funcs(path: str = None, text: str = None, indent: int = 0) -> Dict[str, List[str]]:
@@ -90,6 +92,74 @@ def find_classes(path: str) -> Dict[str, List[str]]:
     return classes
 
 
+def _find_spans(lines: List[str], keyword: str, indent: int = 0) -> Dict[str, Tuple[int, int]]:
+    """find the line ranges of all definitions ("def" or "class") at the given indentation; the
+    rules match those of find_funcs and find_classes
+
+    :param lines: lines of the file (or of a class)
+    :type lines: List[str]
+    :param keyword: definition keyword
+    :type keyword: str
+    :param indent: indentation level, defaults to 0
+    :type indent: int, optional
+    :return: first line index and last line index (exclusive) of each definition
+    :rtype: Dict[str, Tuple[int, int]]
+    """
+    prefix = " " * 4 * indent + f"{keyword} "
+    spans = {}
+    name = None
+    start, end = 0, 0
+    for i, line in enumerate(lines):
+        if line.startswith(prefix):
+            if name is not None:
+                spans[name] = (start, end)
+            name = line.split(f"{keyword} ")[1].split("(")[0]
+            if keyword == "class":
+                name = line.split("class ")[1].split(":")[0].split("(")[0]
+            start, end = i, i + 1
+            continue
+        if name is not None:
+            if (line[0] != " ") and (len(re.findall(r"\w", line)) > 0):
+                spans[name] = (start, end)
+                name = None
+            else:
+                end = i + 1
+    if name is not None:
+        spans[name] = (start, end)
+    return spans
+
+
+def find_entities(path: str) -> Tuple[Dict[str, Entity], Dict[str, Entity]]:
+    """find all classes (with their methods) and functions of a Python file in a single pass over
+    the memory-mapped file; entities only hold byte spans into the file
+
+    :param path: path to the file
+    :type path: str
+    :return: classes and functions
+    :rtype: Tuple[Dict[str, Entity], Dict[str, Entity]]
+    """
+    source = open_source(path)
+    if source is None:
+        return {}, {}
+    raw_lines = source[:].splitlines(keepends=True)
+    lines = [decode_line(line) for line in raw_lines]
+    offsets = [0]
+    for line in raw_lines:
+        offsets.append(offsets[-1] + len(line))
+    functions = {
+        name: Entity(path, offsets[start], offsets[end])
+        for name, (start, end) in _find_spans(lines, "def").items()
+    }
+    classes = {}
+    for name, (start, end) in _find_spans(lines, "class").items():
+        methods = {
+            method: Entity(path, offsets[start + m_start], offsets[start + m_end])
+            for method, (m_start, m_end) in _find_spans(lines[start:end], "def", indent=1).items()
+        }
+        classes[name] = Entity(path, offsets[start], offsets[end], methods=methods)
+    return classes, functions
+
+
 if __name__ == "__main__":
     # CLASSES
     # path = "/workspace/src/codebase_analysis/llm/model.py"
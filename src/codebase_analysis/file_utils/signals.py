@@ -0,0 +1,68 @@
+import ast
+import re
+import textwrap
+
+from codebase_analysis.file_utils.entity import Entity
+
+ENTITY_LABELS = {"functions": "Function", "classes": "Class", "methods": "Method"}
+
+
+def get_signature(code: str) -> str:
+    """returns the header of a function or class (possibly spanning several lines) up to its colon
+
+    :param code: code of the function or class
+    :type code: str
+    :return: signature without the trailing colon
+    :rtype: str
+    """
+    header = []
+    depth = 0
+    for line in code.split("\n"):
+        header.append(line.strip())
+        depth += line.count("(") + line.count("[") - line.count(")") - line.count("]")
+        if depth <= 0 and line.rstrip().endswith(":"):
+            break
+    signature = " ".join(header).rstrip(":")
+    # tidy the line breaks of multi-line signatures
+    signature = re.sub(r"([(\[]) ", r"\1", signature)
+    return re.sub(r",? ([)\]])", r"\1", signature)
+
+
+def get_docstring(code: str) -> str:
+    """returns the docstring of a function or class
+
+    :param code: code of the function or class
+    :type code: str
+    :return: docstring, None if there is none or the code cannot be parsed on its own
+    :rtype: str
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(code))
+    except SyntaxError:
+        return None
+    if len(tree.body) == 0 or not isinstance(
+        tree.body[0], (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+    ):
+        return None
+    return ast.get_docstring(tree.body[0])
+
+
+def describe_entity(_type: str, entity: Entity) -> str:
+    """builds a short description from the cheap signals of an entity (type, signature, docstring,
+    and method names for classes) without calling an LLM
+
+    :param _type: entity type ("functions", "classes", or "methods")
+    :type _type: str
+    :param entity: entity to describe
+    :type entity: Entity
+    :return: description
+    :rtype: str
+    """
+    code = entity.text
+    description = f"{ENTITY_LABELS[_type]} `{get_signature(code)}`."
+    docstring = get_docstring(code)
+    if docstring:
+        description += f"\nDocstring: {docstring}"
+    if entity.methods:
+        description += f"\nMethods: {', '.join(entity.methods)}"
+    return description
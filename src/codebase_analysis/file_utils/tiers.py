@@ -0,0 +1,195 @@
+import ast
+import textwrap
+
+# dunder methods whose behavior is conventional enough that a short body of plain statements (see
+# _is_plain_statement) needs no LLM summary
+BOILERPLATE_DUNDERS = {
+    "__init__",
+    "__repr__",
+    "__str__",
+    "__format__",
+    "__hash__",
+    "__eq__",
+    "__ne__",
+    "__lt__",
+    "__le__",
+    "__gt__",
+    "__ge__",
+    "__bool__",
+    "__len__",
+    "__iter__",
+    "__next__",
+    "__contains__",
+    "__getitem__",
+    "__setitem__",
+    "__delitem__",
+    "__enter__",
+    "__exit__",
+    "__aenter__",
+    "__aexit__",
+    "__getstate__",
+    "__setstate__",
+}
+
+# side-effect free builtins that may be called in the body of a boilerplate dunder
+SAFE_CALLS = {
+    "str",
+    "repr",
+    "format",
+    "hash",
+    "len",
+    "bool",
+    "int",
+    "float",
+    "tuple",
+    "type",
+    "id",
+    "iter",
+    "isinstance",
+}
+
+# the tiers that skip the LLM, with the sentence added to their templated summary
+TRIVIAL_TIERS = {
+    "stub": "It has no implementation (placeholder or abstract).",
+    "empty_class": "It defines no attributes or methods of its own (e.g. an exception type).",
+    "boilerplate": "It is a short special method with the conventional behavior.",
+    "accessor": "It is a one-line accessor that returns or sets a single value.",
+}
+
+
+def _is_docstring(node: ast.stmt) -> bool:
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Constant)
+        and isinstance(node.value.value, str)
+    )
+
+
+def _is_stub_statement(node: ast.stmt) -> bool:
+    """checks for `pass`, `...`, or `raise NotImplementedError`"""
+    if isinstance(node, ast.Pass):
+        return True
+    if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+        return node.value.value is Ellipsis
+    if isinstance(node, ast.Raise) and node.exc is not None:
+        exc = node.exc.func if isinstance(node.exc, ast.Call) else node.exc
+        return isinstance(exc, ast.Name) and exc.id == "NotImplementedError"
+    return False
+
+
+def _is_simple_value(node: ast.expr) -> bool:
+    """checks for a name, constant, or attribute chain (e.g. `self._config.path`)"""
+    while isinstance(node, ast.Attribute):
+        node = node.value
+    return isinstance(node, (ast.Name, ast.Constant))
+
+
+def _is_instance_target(node: ast.expr) -> bool:
+    """checks for an assignment target on the instance, e.g. `self._x`, `self._items[key]`, or a
+    tuple of those (rather than module state such as `REGISTRY[name]` or `os.environ["X"]`)
+    """
+    if isinstance(node, ast.Tuple):
+        return len(node.elts) > 0 and all(_is_instance_target(elt) for elt in node.elts)
+    if not isinstance(node, (ast.Attribute, ast.Subscript)):
+        return False
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return isinstance(node, ast.Name) and node.id == "self"
+
+
+def _is_accessor_statement(node: ast.stmt) -> bool:
+    """checks for `return <value>` or `self.<attr> = <value>`"""
+    if isinstance(node, ast.Return):
+        return node.value is None or _is_simple_value(node.value)
+    if isinstance(node, ast.Assign) and len(node.targets) == 1:
+        target = node.targets[0]
+        return (
+            isinstance(target, ast.Attribute)
+            and _is_instance_target(target)
+            and _is_simple_value(node.value)
+        )
+    return False
+
+
+def _is_safe_expression(node: ast.expr) -> bool:
+    """checks that an expression only calls side-effect free builtins (see SAFE_CALLS)"""
+    for child in ast.walk(node):
+        if isinstance(child, (ast.Await, ast.Yield, ast.YieldFrom, ast.NamedExpr, ast.Lambda)):
+            return False
+        if isinstance(child, ast.Call) and not (
+            isinstance(child.func, ast.Name) and child.func.id in SAFE_CALLS
+        ):
+            return False
+    return True
+
+
+def _is_super_call(node: ast.stmt) -> bool:
+    """checks for `super().<method>(<safe arguments>)`"""
+    if not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Call)):
+        return False
+    func = node.value.func
+    return (
+        isinstance(func, ast.Attribute)
+        and isinstance(func.value, ast.Call)
+        and isinstance(func.value.func, ast.Name)
+        and func.value.func.id == "super"
+        and all(_is_safe_expression(arg) for arg in node.value.args)
+        and all(_is_safe_expression(kw.value) for kw in node.value.keywords)
+    )
+
+
+def _is_plain_statement(node: ast.stmt) -> bool:
+    """checks for a statement without side effects beyond the instance: `return <expression>`,
+    `self.<attr> = <expression>` (or an item of the instance), or `super().<method>(...)`, where the
+    expressions only call side-effect free builtins
+    """
+    if isinstance(node, ast.Return):
+        return node.value is None or _is_safe_expression(node.value)
+    if isinstance(node, ast.Assign):
+        return all(
+            _is_instance_target(target) and _is_safe_expression(target) for target in node.targets
+        ) and _is_safe_expression(node.value)
+    return _is_super_call(node)
+
+
+def classify_entity(code: str, max_lines: int = 4) -> str:
+    """assigns a function, class, or method to a cost tier from its size and structure
+
+    :param code: code of the entity
+    :type code: str
+    :param max_lines: line count above which an entity always goes to the LLM, defaults to 4
+    :type max_lines: int, optional
+    :return: "stub", "empty_class", "boilerplate", or "accessor" for trivial entities (see
+        TRIVIAL_TIERS), "llm" otherwise
+    :rtype: str
+    """
+    lines = textwrap.dedent(code).rstrip("\n").split("\n")
+    # a span can end with the decorators of the next definition
+    while len(lines) > 0 and lines[-1].startswith("@"):
+        lines.pop()
+    try:
+        tree = ast.parse("\n".join(lines))
+    except SyntaxError:
+        return "llm"
+    if len(tree.body) != 1 or not isinstance(
+        tree.body[0], (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+    ):
+        return "llm"
+    node = tree.body[0]
+    body = [stmt for stmt in node.body if not _is_docstring(stmt)]
+    if isinstance(node, ast.ClassDef):
+        # a class without a body is complete, not a placeholder (e.g. `class ConfigError(Exception)`)
+        return "empty_class" if all(_is_stub_statement(stmt) for stmt in body) else "llm"
+    if all(_is_stub_statement(stmt) for stmt in body):
+        return "stub"
+    # the docstring does not count towards the size of the entity
+    size = node.end_lineno - node.lineno + 1
+    if _is_docstring(node.body[0]):
+        size -= node.body[0].end_lineno - node.body[0].lineno + 1
+    if size > max_lines:
+        return "llm"
+    if node.name in BOILERPLATE_DUNDERS and all(_is_plain_statement(stmt) for stmt in body):
+        return "boilerplate"
+    if len(body) == 1 and _is_accessor_statement(body[0]):
+        return "accessor"
+    return "llm"
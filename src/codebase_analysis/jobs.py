@@ -0,0 +1,238 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List
+
+from codebase_analysis.backfill import Backfiller
+from codebase_analysis.db_handler import Orchestrator
+from codebase_analysis.db_utils import schema_name
+from codebase_analysis.file_utils import download_repo, repo_key
+
+# job states; a repo can be queried once its job is "ready" (lazy jobs are backfilling) or "done"
+QUEUED = "queued"
+RUNNING = "running"
+READY = "ready"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+
+def run_index_job(config_path: str, repo_url: str, lazy: bool, status: Dict[str, Any]) -> None:
+    """downloads, breaks down, and indexes a repo into its own schema; runs in a worker process
+
+    :param config_path: path to the config file
+    :type config_path: str
+    :param repo_url: GitHub URL of the repo
+    :type repo_url: str
+    :param lazy: whether to index cheap signals only (the LLM summaries are left to a backfill job)
+    :type lazy: bool
+    :param status: shared status of the job, updated as it progresses
+    :type status: Dict[str, Any]
+    """
+
+    def progress(stage: str, done: int, total: int) -> None:
+        status.update(stage=stage, done=done, total=total)
+
+    status.update(state=RUNNING, stage="downloading", started=time.time())
+    repo_path = download_repo(repo_url)
+    status.update(repo_path=repo_path, stage="breaking down")
+    orch = Orchestrator(
+        config_path=config_path, repo_path=repo_path, init=True, schema=schema_name(repo_path)
+    )
+    description, codebase = orch.get_stats()
+    status.update(description=description, skipped_files=orch.skipped_files)
+    orch.add_data(codebase, lazy=lazy, progress=progress)
+    status.update(summary_stats=orch.summary_stats)
+
+
+def run_backfill_job(config_path: str, status: Dict[str, Any]) -> None:
+    """LLM-summarizes the pending items of a lazily indexed repo; runs in a backfill worker process
+
+    :param config_path: path to the config file
+    :type config_path: str
+    :param status: shared status of the job, updated as it progresses
+    :type status: Dict[str, Any]
+    """
+    orch = Orchestrator(
+        config_path=config_path, init=False, schema=schema_name(status["repo_path"])
+    )
+    backfill = Backfiller(orch).start()
+    while backfill.is_running:
+        status.update(stage="backfilling", done=backfill.done, total=backfill.total)
+        time.sleep(1)
+    status.update(stage="backfilling", done=backfill.done, total=backfill.total)
+
+
+class IndexJobQueue:
+    """local queue of indexing jobs, run in worker processes with bounded concurrency
+
+    Indexing happens outside of the app's script runs, so a browser refresh does not restart it, and
+    the jobs of concurrent users only share the worker pool. A repo that is already being indexed is
+    not submitted twice. Job status lives in a manager process, so it can be polled at any time.
+
+    Lazy ("fast start") jobs free their index worker as soon as the repo is queryable; the LLM
+    summaries are then backfilled by a separate, smaller pool, so long backfills never hold up the
+    indexing of other repos. The job stays "ready" (and deduplicated) until its backfill is over.
+
+    Usage:
+        jobs = IndexJobQueue(config_path)
+        job_id = jobs.submit("https://github.com/rjlicata/llm-sheet-analysis")
+        jobs.status(job_id)["state"]  # "queued", "running", "ready", "done", or "failed"
+    """
+
+    def __init__(self, config_path: str, max_workers: int = 2, max_backfills: int = 1):
+        """initializes IndexJobQueue
+
+        :param config_path: path to the config file
+        :type config_path: str
+        :param max_workers: maximum number of repos indexed at the same time, defaults to 2
+        :type max_workers: int, optional
+        :param max_backfills: maximum number of repos backfilled at the same time, defaults to 1
+        :type max_backfills: int, optional
+        """
+        self._config_path = config_path
+        # spawn rather than fork: the app process runs threads (e.g. the query service loop)
+        context = multiprocessing.get_context("spawn")
+        self._manager = context.Manager()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        self._backfill_executor = ProcessPoolExecutor(max_workers=max_backfills, mp_context=context)
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {}
+        self._futures: Dict[str, Future] = {}
+        # repo key -> id of its latest job
+        self._latest: Dict[str, str] = {}
+
+    def submit(self, repo_url: str, lazy: bool = False) -> str:
+        """queues a repo for indexing, unless a job for the same repo is still in flight
+
+        :param repo_url: GitHub URL of the repo
+        :type repo_url: str
+        :param lazy: whether to index cheap signals first and backfill the LLM summaries in a
+            separate job afterwards, defaults to False
+        :type lazy: bool, optional
+        :return: id of the new job, or of the job already in flight for the repo
+        :rtype: str
+        """
+        key = repo_key(repo_url)
+        with self._lock:
+            job_id = self._latest.get(key)
+            if job_id is not None and self._status[job_id]["state"] not in FINISHED:
+                return job_id
+            job_id = uuid.uuid4().hex
+            status = self._manager.dict(
+                job_id=job_id,
+                repo_url=repo_url,
+                lazy=lazy,
+                state=QUEUED,
+                stage=None,
+                done=0,
+                total=0,
+                submitted=time.time(),
+            )
+            self._status[job_id] = status
+            self._latest[key] = job_id
+            future = self._executor.submit(run_index_job, self._config_path, repo_url, lazy, status)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _finish(self, job_id: str, future: Future) -> None:
+        """records the outcome of an index job and queues the backfill of lazy jobs (and of jobs
+        that left some summaries pending after LLM errors)
+
+        :param job_id: id of the job
+        :type job_id: str
+        :param future: future of the index job
+        :type future: Future
+        """
+        status = self._status[job_id]
+        if future.cancelled():
+            status.update(state=FAILED, error="cancelled", finished=time.time())
+        elif future.exception() is not None:
+            status.update(state=FAILED, error=str(future.exception()), finished=time.time())
+        elif not status["lazy"] and status["summary_stats"].get("failed", 0) == 0:
+            status.update(state=DONE, finished=time.time())
+        else:
+            status.update(state=READY, stage="backfilling", done=0, total=0)
+            try:
+                backfill = self._backfill_executor.submit(
+                    run_backfill_job, self._config_path, status
+                )
+            except RuntimeError:
+                # the queue is shutting down; the summaries are still made on demand
+                status.update(state=DONE, error="backfill cancelled", finished=time.time())
+                return
+            with self._lock:
+                self._futures[job_id] = backfill
+            backfill.add_done_callback(lambda f: self._finish_backfill(job_id, f))
+
+    def _finish_backfill(self, job_id: str, future: Future) -> None:
+        """records the outcome of a backfill; the repo stays queryable (with on-demand summaries)
+        even if the backfill failed, so the job is done either way
+
+        :param job_id: id of the job
+        :type job_id: str
+        :param future: future of the backfill
+        :type future: Future
+        """
+        status = self._status[job_id]
+        if future.cancelled():
+            status.update(state=DONE, error="backfill cancelled", finished=time.time())
+        elif future.exception() is not None:
+            error = f"backfill: {future.exception()}"
+            status.update(state=DONE, error=error, finished=time.time())
+        else:
+            status.update(state=DONE, finished=time.time())
+
+    def find(self, repo_url: str) -> str:
+        """returns the id of the latest job for a repo
+
+        :param repo_url: GitHub URL of the repo
+        :type repo_url: str
+        :return: job id, None if the repo was never submitted
+        :rtype: str
+        """
+        return self._latest.get(repo_key(repo_url))
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        """returns a snapshot of the status of a job
+
+        :param job_id: id of the job
+        :type job_id: str
+        :return: "state", "stage", "done", and "total" of the job, plus its "repo_path",
+            "description", "skipped_files", and "summary_stats" once known and "error" if it failed
+        :rtype: Dict[str, Any]
+        """
+        return dict(self._status[job_id])
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        """returns the status of every job, oldest first
+
+        :return: job statuses
+        :rtype: List[Dict[str, Any]]
+        """
+        return sorted(
+            (dict(status) for status in self._status.values()), key=lambda s: s["submitted"]
+        )
+
+    def cancel(self, job_id: str) -> bool:
+        """cancels a job (or its backfill) that has not started yet
+
+        :param job_id: id of the job
+        :type job_id: str
+        :return: whether the job was cancelled
+        :rtype: bool
+        """
+        return self._futures[job_id].cancel()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """stops the worker pools; queued jobs and backfills are cancelled
+
+        :param wait: whether to wait for the running jobs to finish, defaults to True
+        :type wait: bool, optional
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._backfill_executor.shutdown(wait=wait, cancel_futures=True)
+        self._manager.shutdown()
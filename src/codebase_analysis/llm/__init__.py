@@ -1 +1 @@
-from .model import Embeddings, ModelHandler
+from .model import AsyncEmbeddings, AsyncModelHandler, Embeddings, ModelHandler
@@ -1,6 +1,6 @@
 from typing import Any, Dict, List
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from codebase_analysis.llm.prompts import BASIC_SYSTEM_MESSAGE
 
@@ -123,3 +123,131 @@ class Embeddings:
             .embedding
         )
         return response
+
+    def generate_batch(self, texts: List[str]) -> List[List[float]]:
+        """generate embeddings for several texts in a single request
+
+        :param texts: texts to vectorize
+        :type texts: List[str]
+        :return: generated embedding vectors, in the order of the texts
+        :rtype: List[List[float]]
+        """
+        response = self._client.embeddings.create(
+            input=texts,
+            model=self._model_name,
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class AsyncModelHandler:
+    """asyncio counterpart of ModelHandler
+
+    Unlike ModelHandler, no message history is kept on the instance: every call builds its own
+    message list, so a single handler can serve many concurrent requests.
+    """
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        system_message: str = BASIC_SYSTEM_MESSAGE,
+        temperature: float = 0.7,
+    ):
+        """initializes AsyncModelHandler
+
+        :param config: model config
+        :type config: Dict[str, Any]
+        :param system_message: system message for the LLM, defaults to BASIC_SYSTEM_MESSAGE
+        :type system_message: str, optional
+        :param temperature: generation temperature for the model, defaults to 0.7
+        :type temperature: float, optional
+        """
+        if "/v1" not in config["endpoint_url"]:
+            config["endpoint_url"] += "/v1"
+        self._client = AsyncOpenAI(
+            base_url=config["endpoint_url"],
+            api_key="EMPTY",
+        )
+        self._model_name = config["model_name"]
+        self._system_message = system_message
+        self._temperature = temperature
+
+    async def invoke(self, user_message: str, sys_msg: str = None) -> str:
+        """invokes the LLM with a single user message
+
+        :param user_message: user query
+        :type user_message: str
+        :param sys_msg: user override to system message, defaults to None
+        :type sys_msg: str, optional
+        :return: model response
+        :rtype: str
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": sys_msg if sys_msg is not None else self._system_message,
+            },
+            {
+                "role": "user",
+                "content": user_message,
+            },
+        ]
+        response = await self._client.chat.completions.create(
+            messages=messages,
+            model=self._model_name,
+            temperature=self._temperature,
+        )
+        return response.choices[0].message.content
+
+    async def close(self) -> None:
+        """closes the underlying HTTP client"""
+        await self._client.close()
+
+
+class AsyncEmbeddings:
+    """asyncio counterpart of Embeddings"""
+
+    def __init__(self, config: Dict[str, Any]):
+        """initializes AsyncEmbeddings
+
+        :param config: embedding model config
+        :type config: Dict[str, Any]
+        """
+        if "/v1" not in config["endpoint_url"]:
+            config["endpoint_url"] += "/v1"
+        self._client = AsyncOpenAI(
+            base_url=config["endpoint_url"],
+            api_key="EMPTY",
+        )
+        self._model_name = config.get("model_name", "TEI")
+
+    async def generate(self, text: str) -> List[float]:
+        """generate embeddings from the TEI endpoint
+
+        :param text: text to vectorize
+        :type text: str
+        :return: generated embedding vector
+        :rtype: List[float]
+        """
+        response = await self._client.embeddings.create(
+            input=text,
+            model=self._model_name,
+        )
+        return response.data[0].embedding
+
+    async def generate_batch(self, texts: List[str]) -> List[List[float]]:
+        """generate embeddings for several texts in a single request
+
+        :param texts: texts to vectorize
+        :type texts: List[str]
+        :return: generated embedding vectors, in the order of the texts
+        :rtype: List[List[float]]
+        """
+        response = await self._client.embeddings.create(
+            input=texts,
+            model=self._model_name,
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def close(self) -> None:
+        """closes the underlying HTTP client"""
+        await self._client.close()
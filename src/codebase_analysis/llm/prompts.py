@@ -24,4 +24,21 @@ You will then see the user question after the "QUESTION" key. After the "ANSWER"
 If you use any information from the context, please cite the index in square brackets (example: [functions_1]). \
 Place these citations after you use the information using the index in square brackets. \
 Only use information from the context to answer the question. If the context does not contain the information needed to answer the question, \
-you should let the user know that you cannot answer based on the context provided."""
\ No newline at end of file
+you should let the user know that you cannot answer based on the context provided."""
+
+PACKED_SUMMARIZATION_PROMPT = """You are a helpful assistant that is an expert at summarizing Python code. \
+The user will provide several Python functions, methods, and classes after the "INPUT" key. Each one is introduced by a header line \
+such as "### 1 (function)" giving its id and kind. For each one, utilize information such as its name, arguments, docstrings, \
+comments, and the code itself to generate a concise but informative summary. Summarize each item on its own. \
+After the "SUMMARY" key, respond only with a JSON object that maps every id (as a string) to its summary, for example: \
+{"1": "summary of item 1", "2": "summary of item 2"}"""
+
+SUMMARIZATION_PROMPTS = {
+    "functions": FUNCTION_SUMMARIZATION_PROMPT,
+    "classes": CLASS_SUMMARIZATION_PROMPT,
+    "methods": METHOD_SUMMARIZATION_PROMPT,
+}
+
+SUMMARIZATION_TEMPLATE = "INPUT:\n```\n{code}\n```\nSUMMARY:\n"
+
+PACKED_ITEM_TEMPLATE = "### {id} ({kind})\n```\n{code}\n```\n"
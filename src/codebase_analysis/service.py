@@ -0,0 +1,352 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Tuple
+
+import numpy as np
+import yaml
+
+from codebase_analysis.async_handler import AsyncOrchestrator
+from codebase_analysis.db_utils import schema_name
+from codebase_analysis.llm import AsyncEmbeddings
+
+
+class EmbeddingBatcher:
+    """micro-batches embedding requests from concurrent callers into single embedding calls
+
+    A batch is sent as soon as `max_batch_size` texts are waiting or `max_wait` seconds have passed
+    since the first text of the batch arrived, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        embedder: AsyncEmbeddings,
+        embedding_dim: int,
+        max_batch_size: int = 32,
+        max_wait: float = 0.01,
+        retries: int = 3,
+    ):
+        """initializes EmbeddingBatcher; `start` must be called from the event loop it will run on
+
+        :param embedder: embedding client
+        :type embedder: AsyncEmbeddings
+        :param embedding_dim: dimension of the embedding (used for the fallback zero vector)
+        :type embedding_dim: int
+        :param max_batch_size: maximum number of texts per embedding call, defaults to 32
+        :type max_batch_size: int, optional
+        :param max_wait: maximum time in seconds a text waits for a batch to fill, defaults to 0.01
+        :type max_wait: float, optional
+        :param retries: number of attempts per batch before falling back to zero vectors, defaults to 3
+        :type retries: int, optional
+        """
+        self._embedder = embedder
+        self._embedding_dim = embedding_dim
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._retries = retries
+        self._queue = None
+        self._task = None
+        self.batch_sizes: Deque[int] = deque(maxlen=1000)
+        self.batch_latencies: Deque[float] = deque(maxlen=1000)
+
+    @property
+    def queue_depth(self) -> int:
+        """number of texts waiting to be batched"""
+        return 0 if self._queue is None else self._queue.qsize()
+
+    def start(self) -> None:
+        """starts the batching loop on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """stops the batching loop"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def embed(self, text: str) -> List[float]:
+        """embeds a single text as part of the next batch
+
+        :param text: text to vectorize
+        :type text: str
+        :return: embedding
+        :rtype: List[float]
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        """waits for the next batch of texts
+
+        :return: texts and the futures of their callers
+        :rtype: List[Tuple[str, asyncio.Future]]
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # callers that gave up while waiting don't need an embedding
+        return [(text, future) for text, future in batch if not future.cancelled()]
+
+    async def _generate(self, texts: List[str]) -> List[List[float]]:
+        """embeds a batch of texts
+
+        :param texts: texts to vectorize
+        :type texts: List[str]
+        :return: embeddings
+        :rtype: List[List[float]]
+        """
+        for _ in range(self._retries):
+            try:
+                return await self._embedder.generate_batch(texts)
+            except Exception as e:
+                print(f"Error generating embedding: {e}")
+        return [[0.0] * self._embedding_dim for _ in texts]
+
+    async def _run(self) -> None:
+        """batching loop"""
+        while True:
+            batch = await self._collect()
+            if len(batch) == 0:
+                continue
+            start = time.perf_counter()
+            embeddings = await self._generate([text for text, _ in batch])
+            self.batch_latencies.append(time.perf_counter() - start)
+            self.batch_sizes.append(len(batch))
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+
+class QueryService:
+    """long-lived, in-process query service shared by all chat sessions
+
+    It runs an asyncio event loop in a background thread, keeps a warm AsyncOrchestrator for each
+    of the most recently queried repos, and micro-batches the question embeddings of concurrent
+    users. Sessions call the blocking `query` method from their own threads.
+    """
+
+    def __init__(
+        self,
+        config_path: str,
+        max_context: int = 5,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10.0,
+        max_connections: int = 10,
+        max_repos: int = 4,
+    ):
+        """initializes QueryService; call `start` before querying
+
+        :param config_path: path to the config file
+        :type config_path: str
+        :param max_context: maximum number of summaries to provide the model for answering, defaults to 5
+        :type max_context: int, optional
+        :param max_batch_size: maximum number of questions per embedding call, defaults to 32
+        :type max_batch_size: int, optional
+        :param max_wait_ms: maximum time in milliseconds a question waits for a batch to fill, defaults to 10.0
+        :type max_wait_ms: float, optional
+        :param max_connections: maximum number of pooled database connections per repo, defaults to 10
+        :type max_connections: int, optional
+        :param max_repos: number of repos kept warm; the least recently used idle one is closed
+            beyond that (bounding the service to max_repos * max_connections connections), defaults
+            to 4
+        :type max_repos: int, optional
+        """
+        self._config_path = config_path
+        with open(config_path, "r") as f:
+            self._config = yaml.safe_load(f)
+        self._max_context = max_context
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._max_connections = max_connections
+        self._max_repos = max_repos
+        self._loop = None
+        self._thread = None
+        self._batcher = None
+        # least recently used first
+        self._orchestrators: Dict[str, AsyncOrchestrator] = OrderedDict()
+        # number of questions using each orchestrator (those are never closed)
+        self._users: Dict[str, int] = {}
+        self._orchestrator_lock = None
+        self._in_flight = 0
+        self._query_latencies: Deque[float] = deque(maxlen=1000)
+
+    def start(self) -> "QueryService":
+        """starts the event loop thread and the embedding batcher
+
+        :return: the started service
+        :rtype: QueryService
+        """
+        if self._thread is not None:
+            return self
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    async def _start(self) -> None:
+        """creates the loop-bound state"""
+        self._orchestrator_lock = asyncio.Lock()
+        self._batcher = EmbeddingBatcher(
+            AsyncEmbeddings(self._config["embeddings"]),
+            embedding_dim=self._config["embeddings"]["embedding_dim"],
+            max_batch_size=self._max_batch_size,
+            max_wait=self._max_wait,
+        )
+        self._batcher.start()
+
+    def stop(self) -> None:
+        """closes every orchestrator and stops the event loop thread"""
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+
+    async def _stop(self) -> None:
+        """closes the loop-bound state"""
+        await self._batcher.stop()
+        for orch in self._orchestrators.values():
+            await orch.close()
+        self._orchestrators = OrderedDict()
+        self._users = {}
+
+    async def _acquire(self, repo_path: str) -> AsyncOrchestrator:
+        """returns the warm orchestrator of a repo, creating it on first use; release it with
+        `_release` once done
+
+        :param repo_path: path of the indexed repo
+        :type repo_path: str
+        :return: orchestrator for the repo
+        :rtype: AsyncOrchestrator
+        """
+        async with self._orchestrator_lock:
+            if repo_path not in self._orchestrators:
+                orch = AsyncOrchestrator(
+                    self._config_path,
+                    max_context=self._max_context,
+                    max_connections=self._max_connections,
+                    schema=schema_name(repo_path),
+                )
+                try:
+                    await orch.connect()
+                except BaseException:
+                    await orch.close()
+                    raise
+                self._orchestrators[repo_path] = orch
+            self._orchestrators.move_to_end(repo_path)
+            self._users[repo_path] = self._users.get(repo_path, 0) + 1
+            await self._evict()
+            return self._orchestrators[repo_path]
+
+    def _release(self, repo_path: str) -> None:
+        """marks a question on a repo as finished
+
+        :param repo_path: path of the indexed repo
+        :type repo_path: str
+        """
+        self._users[repo_path] -= 1
+        if self._users[repo_path] == 0:
+            del self._users[repo_path]
+            if len(self._orchestrators) > self._max_repos:
+                # repos kept past the limit while busy are closed once idle
+                asyncio.get_running_loop().create_task(self._evict_idle())
+
+    async def _evict_idle(self) -> None:
+        """closes the idle orchestrators beyond `max_repos` (taking the lock)"""
+        async with self._orchestrator_lock:
+            await self._evict()
+
+    async def _evict(self) -> None:
+        """closes the least recently used idle orchestrators beyond `max_repos`"""
+        idle = [repo for repo in self._orchestrators if repo not in self._users]
+        for repo in idle[: max(len(self._orchestrators) - self._max_repos, 0)]:
+            await self._orchestrators.pop(repo).close()
+
+    async def _query(self, repo_path: str, question: str) -> str:
+        """answers a question about a repo
+
+        :param repo_path: path of the indexed repo
+        :type repo_path: str
+        :param question: user question
+        :type question: str
+        :return: response from the model
+        :rtype: str
+        """
+        start = time.perf_counter()
+        self._in_flight += 1
+        try:
+            # embed the question while the orchestrator is looked up (or connected)
+            embedding = asyncio.ensure_future(self._batcher.embed(question))
+            try:
+                orch = await self._acquire(repo_path)
+            except BaseException:
+                embedding.cancel()
+                raise
+            try:
+                response = await orch.answer(question, await embedding)
+            finally:
+                self._release(repo_path)
+        finally:
+            self._in_flight -= 1
+        self._query_latencies.append(time.perf_counter() - start)
+        return response
+
+    def query(self, repo_path: str, question: str, timeout: float = None) -> str:
+        """answers a question about a repo; blocks the calling thread until the answer is ready
+
+        :param repo_path: path of the indexed repo
+        :type repo_path: str
+        :param question: user question
+        :type question: str
+        :param timeout: seconds to wait before the question is cancelled, defaults to None (no limit)
+        :type timeout: float, optional
+        :return: response from the model
+        :rtype: str
+        """
+        future = asyncio.run_coroutine_threadsafe(self._query(repo_path, question), self._loop)
+        try:
+            return future.result(timeout=timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """reports the queue depth, batching, and latency of the service
+
+        :return: service statistics (latencies in milliseconds)
+        :rtype: Dict[str, Any]
+        """
+
+        def percentiles(values: Deque[float]) -> Dict[str, float]:
+            if len(values) == 0:
+                return {"p50_ms": 0.0, "p95_ms": 0.0}
+            p50, p95 = np.percentile(np.array(list(values)) * 1000, [50, 95])
+            return {"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1)}
+
+        batch_sizes = list(self._batcher.batch_sizes) if self._batcher is not None else []
+        return {
+            "repos": len(self._orchestrators),
+            "queue_depth": self._batcher.queue_depth if self._batcher is not None else 0,
+            "in_flight": self._in_flight,
+            "embedding_batches": len(batch_sizes),
+            "mean_batch_size": round(float(np.mean(batch_sizes)), 2) if batch_sizes else 0.0,
+            "embedding_latency": percentiles(
+                self._batcher.batch_latencies if self._batcher is not None else deque()
+            ),
+            "query_latency": percentiles(self._query_latencies),
+        }